@@ -0,0 +1,37 @@
+"""
+共享 HTTP 客户端
+各 LLM Provider 复用同一个 httpx.AsyncClient，连接池（TCP + TLS）跨请求存活，
+避免每次构建模型都重新握手；支持 HTTP/2 多路复用（安装 h2 时自动启用）
+"""
+import logging
+from typing import Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 连接池配置：keep-alive 数量放宽到 100，覆盖并行会话的模型调用
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=100)
+_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_async_client() -> httpx.AsyncClient:
+    """获取进程内共享的 httpx.AsyncClient（懒创建）"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        try:
+            _async_client = httpx.AsyncClient(http2=True, timeout=_TIMEOUT, limits=_LIMITS)
+        except ImportError:
+            # 未安装 h2 可选依赖：退化为 HTTP/1.1，仍然复用连接池
+            logger.info("未安装 h2，共享 HTTP 客户端使用 HTTP/1.1")
+            _async_client = httpx.AsyncClient(timeout=_TIMEOUT, limits=_LIMITS)
+    return _async_client
+
+
+async def aclose_shared_async_client():
+    """关闭共享客户端（应用关停时调用）"""
+    global _async_client
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
@@ -5,6 +5,7 @@ import os
 import logging
 from langchain_openai import ChatOpenAI
 from app.llm.base import BaseLLMProvider
+from app.llm.http_client import get_shared_async_client
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +38,8 @@ class SiliconFlowLLMProvider(BaseLLMProvider):
             max_tokens=2048,
             # 关键：禁止并行工具调用，强制"一次调用一个工具 -> 等结果 -> 再下一次"
             model_kwargs={"parallel_tool_calls": False},
+            # 复用共享连接池，流式调用不必每次重新做 TCP/TLS 握手
+            http_async_client=get_shared_async_client(),
         )
         
         return model
@@ -7,6 +7,7 @@ import logging
 from typing import Optional
 from langchain_openai import ChatOpenAI
 from app.llm.base import BaseLLMProvider
+from app.llm.http_client import get_shared_async_client
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +64,8 @@ class VolcanoLLMProvider(BaseLLMProvider):
             streaming=True,  # 启用流式输出
             max_tokens=2048,
             model_kwargs=model_kwargs,
+            # 复用共享连接池，流式调用不必每次重新做 TCP/TLS 握手
+            http_async_client=get_shared_async_client(),
         )
         
         return model
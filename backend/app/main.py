@@ -2,32 +2,82 @@
 PolyStudio后端主程序
 使用FastAPI + LangGraph实现
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.routers import chat, settings
 import os
+import logging
 from dotenv import load_dotenv
 from app.utils.logger import setup_logging
 from app.services.connection_manager import manager
 from app.services import workspace_service
+from app.services.agent_service import get_agent
+from app.services.history_service import history_service
+from app.llm.http_client import aclose_shared_async_client
 
 load_dotenv()
 
+# 安装 uvloop 事件循环（libuv 实现，网络密集的 SSE 场景下吞吐明显高于默认 asyncio 循环）
+# Windows 或未安装时回退到默认循环；uvicorn[standard] 在 Linux/macOS 下自带 uvloop
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:  # pragma: no cover
+    uvloop = None
+
 # 初始化日志系统（在应用启动时配置）
 log_level = os.getenv("LOG_LEVEL", "INFO")
 setup_logging(log_level=log_level)
 
-app = FastAPI(title="PolyStudio API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动预热 + 关停清理
+
+    把 Agent 构建（含提示词拼接、共享 HTTP 客户端创建）和历史库打开的
+    冷启动成本移到启动阶段，首个用户请求不再额外等待几百毫秒。
+    """
+    try:
+        get_agent()
+        logger.info("🔥 Agent 预热完成")
+    except Exception as e:
+        # 缺少 API Key 等配置时不阻止服务启动，首次 /chat 会给出同样的错误提示
+        logger.warning(f"⚠️ Agent 预热失败（不影响启动）: {e}")
+    try:
+        await history_service.get_canvases()
+    except Exception as e:
+        logger.warning(f"⚠️ 历史存储预热失败（不影响启动）: {e}")
+
+    yield
+
+    # 关停：释放共享 HTTP 连接池与历史库连接
+    await aclose_shared_async_client()
+    await history_service.close()
+
+
+app = FastAPI(title="PolyStudio API", version="1.0.0", lifespan=lifespan)
 
 # 配置CORS
+# 注意：allow_origins=["*"] 搭配 allow_credentials=True 会被浏览器视为非法组合，
+# 且无法缓存预检结果。这里改为显式来源（FRONTEND_ORIGIN，逗号分隔可配多个），
+# 关闭 credentials（未使用 cookie），并设置 max_age 让浏览器缓存 OPTIONS 预检一天
+frontend_origins = [
+    origin.strip()
+    for origin in os.getenv("FRONTEND_ORIGIN", "http://localhost:3000").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # 生产环境应该限制具体域名
-    allow_credentials=True,
+    allow_origins=frontend_origins,
+    allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400,
 )
 
 # 确保存储目录存在
@@ -83,15 +133,30 @@ async def health():
 
 if __name__ == "__main__":
     import uvicorn
-    import os
-    import sys
-    # 确保使用当前 Python 解释器
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        reload_includes=["*.py"],
-        log_level="info"
-    )
+    # worker 数量：多核机器上设置 WEB_CONCURRENCY>1 可让各会话真正并行
+    # （历史存储是 WAL 模式的 SQLite，见 history_service，多 worker 并发读写安全）
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        # 多 worker 与热重载互斥
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=workers,
+            log_level="info",
+            loop="uvloop" if uvloop is not None else "auto",
+            http="httptools",
+        )
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            reload_includes=["*.py"],
+            log_level="info",
+            # uvloop + httptools：uvicorn[standard] 自带的高性能事件循环/HTTP解析器
+            loop="uvloop" if uvloop is not None else "auto",
+            http="httptools",
+        )
 
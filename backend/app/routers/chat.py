@@ -2,24 +2,50 @@
 聊天路由 - 处理对话请求
 """
 from fastapi import APIRouter, HTTPException, Request, UploadFile, File
-from fastapi.responses import StreamingResponse
+from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-import json
 import os
+import time
 import uuid
-import asyncio
+import aiofiles
 import logging
-from datetime import datetime
 from pathlib import Path
 from app.services.agent_service import process_chat_stream
 from app.services.history_service import history_service
 from app.services.connection_manager import manager
+from app.services.stream_processor import json_dumps
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 存储目录在导入时解析并创建一次，省掉每次上传的路径拼接和 mkdir 系统调用
+_STORAGE_DIR = Path(__file__).resolve().parents[2] / "storage"
+_IMAGES_DIR = _STORAGE_DIR / "images"
+_AUDIOS_DIR = _STORAGE_DIR / "audios"
+_VIDEOS_DIR = _STORAGE_DIR / "videos"
+for _dir in (_IMAGES_DIR, _AUDIOS_DIR, _VIDEOS_DIR):
+    _dir.mkdir(parents=True, exist_ok=True)
+
+# 上传大小上限（MB），超过直接拒绝，不读取任何文件内容
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "50"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+# 分块写盘的块大小：避免把整个文件一次性读进内存
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 形状固定的流结束帧在导入时构造/编码一次，每次流关闭不再重复分配和 JSON 编码
+_DONE_FRAME = {"data": "[DONE]"}
+_DONE_BROADCAST = json_dumps({"type": "done"})
+
+
+async def _stream_upload_to_disk(file: UploadFile, file_path: Path):
+    """把上传文件分块写入磁盘（aiofiles 异步写，内存占用恒定）"""
+    async with aiofiles.open(file_path, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await f.write(chunk)
+
 
 class ChatRequest(BaseModel):
     message: str
@@ -31,7 +57,7 @@ class ChatRequest(BaseModel):
 @router.get("/canvases")
 async def get_canvases():
     """获取所有画布历史"""
-    return history_service.get_canvases()
+    return await history_service.get_canvases()
 
 
 @router.post("/canvases")
@@ -43,13 +69,13 @@ async def save_canvas(request: Request):
     这里直接存原始 JSON，避免 data 被过滤导致刷新后画布空白。
     """
     payload = await request.json()
-    return history_service.save_canvas(payload)
+    return await history_service.save_canvas(payload)
 
 
 @router.delete("/canvases/{canvas_id}")
 async def delete_canvas(canvas_id: str):
     """删除画布"""
-    history_service.delete_canvas(canvas_id)
+    await history_service.delete_canvas(canvas_id)
     return {"success": True}
 
 
@@ -62,19 +88,19 @@ async def upload_image(file: UploadFile = File(...)):
         上传后的图片URL（相对路径，如 /storage/images/xxx.jpg）
     """
     try:
-        # 确保上传目录存在
-        BASE_DIR = Path(__file__).parent.parent.parent
-        IMAGES_DIR = BASE_DIR / "storage" / "images"
-        IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-        
         # 验证文件类型
         content_type = file.content_type or ""
         if not content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="只支持图片文件")
-        
+
+        # 基于 Content-Length 提前拒绝超大文件（不用先读字节）
+        if file.size and file.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"文件过大，最大支持 {MAX_UPLOAD_SIZE_MB}MB")
+
         # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
+        # time_ns 保持文件名可按时间排序；uuid4().hex 免去 str() 转换和切片分配
+        timestamp = time.time_ns()
+        unique_id = uuid.uuid4().hex
         
         # 获取文件扩展名
         original_filename = file.filename or "image"
@@ -83,17 +109,17 @@ async def upload_image(file: UploadFile = File(...)):
             ext = ".jpg"
         
         filename = f"upload_{timestamp}_{unique_id}{ext}"
-        file_path = IMAGES_DIR / filename
-        
-        # 保存文件
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
+        file_path = _IMAGES_DIR / filename
+
+        # 分块流式保存，避免整个文件先进内存
+        await _stream_upload_to_disk(file, file_path)
+
         # 返回相对路径
         image_url = f"/storage/images/{filename}"
         return {"url": image_url, "filename": filename}
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
@@ -108,11 +134,6 @@ async def upload_audio(file: UploadFile = File(...)):
         上传后的音频URL（相对路径，如 /storage/audios/xxx.mp3 或 /storage/audios/xxx.wav）
     """
     try:
-        # 确保上传目录存在
-        BASE_DIR = Path(__file__).parent.parent.parent
-        AUDIOS_DIR = BASE_DIR / "storage" / "audios"
-        AUDIOS_DIR.mkdir(parents=True, exist_ok=True)
-        
         # 验证文件类型
         content_type = file.content_type or ""
         # 支持的音频 MIME 类型
@@ -142,15 +163,16 @@ async def upload_audio(file: UploadFile = File(...)):
             )
         
         # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
+        # time_ns 保持文件名可按时间排序；uuid4().hex 免去 str() 转换和切片分配
+        timestamp = time.time_ns()
+        unique_id = uuid.uuid4().hex
         
         # 获取文件扩展名，如果没有则默认使用 .mp3
         if not ext or ext not in allowed_extensions:
             ext = ".mp3"
         
         filename = f"upload_{timestamp}_{unique_id}{ext}"
-        file_path = AUDIOS_DIR / filename
+        file_path = _AUDIOS_DIR / filename
         
         # 保存文件
         with open(file_path, "wb") as f:
@@ -177,10 +199,6 @@ async def upload_video(file: UploadFile = File(...)):
         上传后的视频URL（相对路径，如 /storage/videos/xxx.mp4）
     """
     try:
-        BASE_DIR = Path(__file__).parent.parent.parent
-        VIDEOS_DIR = BASE_DIR / "storage" / "videos"
-        VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
-
         content_type = file.content_type or ""
         original_filename = file.filename or "video"
         ext = os.path.splitext(original_filename)[1].lower()
@@ -193,13 +211,14 @@ async def upload_video(file: UploadFile = File(...)):
                 detail=f"只支持视频文件，支持的格式：{', '.join(allowed_extensions)}"
             )
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
+        # time_ns 保持文件名可按时间排序；uuid4().hex 免去 str() 转换和切片分配
+        timestamp = time.time_ns()
+        unique_id = uuid.uuid4().hex
         if not ext or ext not in allowed_extensions:
             ext = ".mp4"
 
         filename = f"upload_{timestamp}_{unique_id}{ext}"
-        file_path = VIDEOS_DIR / filename
+        file_path = _VIDEOS_DIR / filename
 
         with open(file_path, "wb") as f:
             content = await file.read()
@@ -218,16 +237,13 @@ async def upload_video(file: UploadFile = File(...)):
 async def chat(request: ChatRequest):
     """
     处理聊天请求，返回流式响应
-    支持OpenAI格式的流式输出
+    支持OpenAI格式的流式输出（SSE 封帧由 sse-starlette 的 EventSourceResponse 完成）
     若请求包含 canvas_id，同时将每个 SSE 事件广播给订阅该 canvas 的 WebSocket 客户端
     """
     try:
-        # 构建消息历史
-        messages = request.messages.copy() if request.messages else []
-        messages.append({
-            "role": "user",
-            "content": request.message
-        })
+        # 历史和新用户消息分开传递，由流处理器一次性转换为 LangChain 消息
+        # （避免这里先 copy+append 成字典、下游再整体重转一遍的双重 O(N) 开销）
+        history = request.messages or []
 
         canvas_id = request.canvas_id
 
@@ -237,46 +253,41 @@ async def chat(request: ChatRequest):
             tool_results: list[dict] = []
 
             # 广播用户消息给前端（await 直接调用，不用 create_task）
-            user_event = json.dumps({"type": "user_message", "content": request.message}, ensure_ascii=False)
+            user_event = json_dumps({"type": "user_message", "content": request.message})
             if canvas_id:
                 await manager.broadcast(canvas_id, user_event)
             else:
                 await manager.broadcast_all(user_event)
 
-            async for chunk in process_chat_stream(messages, request.session_id):
-                yield chunk
-                if chunk.startswith("data: "):
-                    data_str = chunk[len("data: "):].strip()
-                    if data_str and data_str != "[DONE]":
-                        # 广播给前端
-                        if canvas_id:
-                            await manager.broadcast(canvas_id, data_str)
-                        else:
-                            await manager.broadcast_all(data_str)
-                        # 收集 assistant 文本内容与工具调用结果
-                        try:
-                            ev = json.loads(data_str)
-                            ev_type = ev.get("type")
-                            if ev_type == "delta" and ev.get("content"):
-                                assistant_content += ev["content"]
-                            elif ev_type == "tool_result":
-                                # 保留工具调用结果（含图片/视频 URL 等）
-                                tool_results.append({
-                                    "tool_call_id": ev.get("tool_call_id"),
-                                    "content": ev.get("content"),
-                                })
-                        except Exception:
-                            pass
-                    elif data_str == "[DONE]":
-                        done_event = json.dumps({"type": "done"}, ensure_ascii=False)
-                        if canvas_id:
-                            await manager.broadcast(canvas_id, done_event)
-                        else:
-                            await manager.broadcast_all(done_event)
+            async for ev in process_chat_stream(history, request.message, request.session_id):
+                # 只序列化一次：同一份 JSON 既作为 SSE data 也用于 WebSocket 广播
+                data_str = json_dumps(ev)
+                yield {"data": data_str}
+                # 广播给前端
+                if canvas_id:
+                    await manager.broadcast(canvas_id, data_str)
+                else:
+                    await manager.broadcast_all(data_str)
+                # 收集 assistant 文本内容与工具调用结果
+                ev_type = ev.get("type")
+                if ev_type == "delta" and ev.get("content"):
+                    assistant_content += ev["content"]
+                elif ev_type == "tool_result":
+                    # 保留工具调用结果（含图片/视频 URL 等）
+                    tool_results.append({
+                        "tool_call_id": ev.get("tool_call_id"),
+                        "content": ev.get("content"),
+                    })
+
+            # 流结束：通知 SSE 客户端与 WebSocket 订阅者
+            yield _DONE_FRAME
+            if canvas_id:
+                await manager.broadcast(canvas_id, _DONE_BROADCAST)
+            else:
+                await manager.broadcast_all(_DONE_BROADCAST)
 
             # 流结束后保存历史
             try:
-                import time
                 ts = int(time.time() * 1000)
 
                 # 构建本轮新增的消息（用户 + 助手）
@@ -292,12 +303,11 @@ async def chat(request: ChatRequest):
 
                 if canvas_id:
                     # 已有项目：加载原有 canvas，追加本轮消息，不新建项目
-                    existing_canvases = history_service.get_canvases()
-                    existing = next((c for c in existing_canvases if c.get("id") == canvas_id), None)
+                    existing = await history_service.get_canvas(canvas_id)
                     if existing:
                         existing_messages = existing.get("messages", [])
                         existing["messages"] = existing_messages + new_messages
-                        await asyncio.to_thread(history_service.save_canvas, existing)
+                        await history_service.save_canvas(existing)
                     else:
                         # canvas_id 在历史中找不到（可能已删除），退化为新建
                         canvas_to_save = {
@@ -307,7 +317,7 @@ async def chat(request: ChatRequest):
                             "messages": new_messages,
                             "data": {"elements": [], "appState": {}, "files": {}},
                         }
-                        await asyncio.to_thread(history_service.save_canvas, canvas_to_save)
+                        await history_service.save_canvas(canvas_to_save)
                 else:
                     # 没有 canvas_id：新建项目
                     new_canvas = {
@@ -317,21 +327,13 @@ async def chat(request: ChatRequest):
                         "messages": new_messages,
                         "data": {"elements": [], "appState": {}, "files": {}},
                     }
-                    await asyncio.to_thread(history_service.save_canvas, new_canvas)
+                    await history_service.save_canvas(new_canvas)
             except Exception as e:
                 logger.warning(f"保存对话历史失败: {e}")
 
-        # 返回流式响应 - 确保立即发送，不缓冲
-        return StreamingResponse(
-            stream_and_save(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-                "Content-Type": "text/event-stream; charset=utf-8"
-            }
-        )
+        # 返回流式响应 - EventSourceResponse 负责 SSE 封帧、
+        # no-cache/X-Accel-Buffering 头和周期性 ping 保活
+        return EventSourceResponse(stream_and_save(), ping=15)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,9 +1,9 @@
 """
 Agent服务 - 处理LangGraph Agent的流式输出
 """
-import json
 import os
 import logging
+from functools import lru_cache
 from typing import List, Dict, Any, AsyncGenerator, Optional
 from langgraph.prebuilt import create_react_agent
 from app.services.stream_processor import StreamProcessor
@@ -26,95 +26,120 @@ from app.services import workspace_service
 logger = logging.getLogger(__name__)
 
 
+# 工具列表是模块级常量：在导入时构建一次，
+# 避免每次 create_agent 都重新循环拼接工具描述
+TOOLS = [
+    # generate_image_tool,
+    # edit_image_tool,
+    generate_volcano_image_tool,
+    edit_volcano_image_tool,
+    generate_3d_model_tool,
+    generate_volcano_video_tool,
+    concatenate_videos_tool,
+    detect_face_tool,
+    generate_virtual_anchor_tool,
+    # Qwen-TTS工具
+    qwen_voice_design_tool,
+    qwen_voice_cloning_tool,
+    # 音频混音工具
+    concatenate_audio_tool,
+    select_bgm_tool,
+    mix_audio_with_bgm_tool,
+    # Qwen3-Omni 多模态理解工具
+    qwen_omni_understand_tool,
+    # Skill 文件读取工具（Progressive Loading）
+    read_skill_file_tool,
+    list_skill_dir_tool,
+    # Skill 创建工具（skill-creator 工作流支持）
+    init_skill_tool,
+    write_skill_file_tool,
+    delete_skill_file_tool,
+    # Workspace 记忆写入工具
+    write_memory,
+]
+
+# 工具列表描述是真正的进程内不变量，预先拼好；
+# skills/workspace 上下文会被设置页和 Agent 自己的工具改写，必须在构建 Agent 时现算
+TOOLS_LIST_TEXT = "\n".join(f"- {tool.name}: {tool.description}" for tool in TOOLS)
+
+
 def create_agent():
     """创建LangGraph Agent"""
     # 使用 LLM 工厂创建模型实例（默认使用火山引擎）
     model = create_llm()
 
-    # 创建工具列表
-    tools = [
-        # generate_image_tool,
-        # edit_image_tool,
-        generate_volcano_image_tool,
-        edit_volcano_image_tool,
-        generate_3d_model_tool,
-        generate_volcano_video_tool,
-        concatenate_videos_tool,
-        detect_face_tool,
-        generate_virtual_anchor_tool,
-        # Qwen-TTS工具
-        qwen_voice_design_tool,
-        qwen_voice_cloning_tool,
-        # 音频混音工具
-        concatenate_audio_tool,
-        select_bgm_tool,
-        mix_audio_with_bgm_tool,
-        # Qwen3-Omni 多模态理解工具
-        qwen_omni_understand_tool,
-        # Skill 文件读取工具（Progressive Loading）
-        read_skill_file_tool,
-        list_skill_dir_tool,
-        # Skill 创建工具（skill-creator 工作流支持）
-        init_skill_tool,
-        write_skill_file_tool,
-        delete_skill_file_tool,
-        # Workspace 记忆写入工具
-        write_memory,
-    ]
-    logger.info(f"🛠️  注册工具: {[tool.name for tool in tools]}")
-
-    # 动态生成工具列表描述
-    tool_descriptions = []
-    for tool in tools:
-        tool_descriptions.append(f"- {tool.name}: {tool.description}")
-    tools_list_text = "\n".join(tool_descriptions)
-
-    # 使用prompt模块生成完整提示词
-    skills_context = skill_service.get_skills_context()
-    workspace_context = workspace_service.get_workspace_context()
-    full_prompt = get_full_prompt(
-        tools_list_text=tools_list_text,
-        skills_context=skills_context,
-        workspace_context=workspace_context,
+    logger.info(f"🛠️  注册工具: {[tool.name for tool in TOOLS]}")
+
+    # 提示词在每次构建 Agent 时重新拼接：
+    # skill 开关（设置页）、MEMORY.md（write_memory / 设置页编辑器）、
+    # 自定义 skill（init_skill / write_skill_file）都会改变注入的上下文
+    system_prompt = get_full_prompt(
+        tools_list_text=TOOLS_LIST_TEXT,
+        skills_context=skill_service.get_skills_context(),
+        workspace_context=workspace_service.get_workspace_context(),
     )
 
     # 创建Agent
     agent = create_react_agent(
         name="polystudio_multimodal_agent",
         model=model,
-        tools=tools,
-        prompt=full_prompt
+        tools=TOOLS,
+        prompt=system_prompt
     )
-    
+
     logger.info("✅ Agent创建成功")
     return agent
 
 
+@lru_cache(maxsize=1)
+def get_agent():
+    """获取缓存的Agent实例
+
+    Agent 对每次调用的 messages 参数是无状态的，没必要每个请求都重建
+    （重建会重新构造 ChatOpenAI、重新拼接提示词、重新编译 ReAct 图）。
+    这里用 lru_cache 保证只构建一次，后续请求直接复用。
+    提示词依赖的 skills/workspace 状态变化时，由 invalidate_agent() 清缓存。
+    """
+    return create_agent()
+
+
+def invalidate_agent() -> None:
+    """使缓存的 Agent 失效，下次请求按当前 skills/workspace 状态重建
+
+    由改写提示词输入的路径调用：skill 启用开关、workspace 文件保存、
+    skill-creator 工具的写入/删除。
+    """
+    get_agent.cache_clear()
+    logger.info("♻️ Agent 缓存已失效，下次请求将重建提示词")
+
+
 async def process_chat_stream(
-    messages: List[Dict[str, Any]],
+    history: List[Dict[str, Any]],
+    message: str,
     session_id: Optional[str] = None
-) -> AsyncGenerator[str, None]:
+) -> AsyncGenerator[Dict[str, Any], None]:
     """
     处理聊天流式响应
-    
+
     Args:
-        messages: 消息历史
+        history: 消息历史（OpenAI 格式字典，不含本轮用户消息）
+        message: 本轮用户消息
         session_id: 会话ID
-    
+
     Yields:
-        SSE格式的事件流
+        事件 payload 字典（SSE 封帧由路由层的 EventSourceResponse 完成）
     """
     try:
-        logger.info(f"💬 收到聊天请求: session_id={session_id}, messages_count={len(messages)}")
-        
-        # 创建Agent（在 langgraph 1.0.0 中，create_react_agent 返回的对象已经是编译后的）
-        agent = create_agent()
+        logger.info(f"💬 收到聊天请求: session_id={session_id}, history_count={len(history)}")
+
+        # 获取缓存的Agent（在 langgraph 1.0.0 中，create_react_agent 返回的对象已经是编译后的）
+        agent = get_agent()
 
         # 创建流处理器
         processor = StreamProcessor(session_id)
 
         # 处理流式响应
-        async for event in processor.process_stream(agent, messages):
+        async for event in processor.process_stream(agent, history, message):
             try:
                 yield event
             except (GeneratorExit, StopAsyncIteration, ConnectionError, BrokenPipeError, OSError) as e:
@@ -137,12 +162,10 @@ async def process_chat_stream(
         logger.error(traceback.format_exc())
         try:
             # 尝试发送错误事件（如果客户端还在）
-            error_event = {
+            yield {
                 "type": "error",
                 "error": str(e)
             }
-            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
-            yield "data: [DONE]\n\n"
         except:
             # 如果发送失败（客户端已断开），忽略
             pass
@@ -1,12 +1,36 @@
 import json
 import os
+import time
+import asyncio
 import logging
+
+import anyio.to_thread
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 
+import aiosqlite
+
 logger = logging.getLogger(__name__)
 
-HISTORY_FILE = "storage/chat_history.json"
+# 优先使用 orjson（C 实现），大画布（Excalidraw elements/files）编码快数倍且输出更紧凑
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    _json_loads = json.loads
+
+# SQLite 数据库：单条画布的点更新是 O(log N)，WAL 模式下可被多个 uvicorn worker 安全共享
+HISTORY_DB_FILE = "storage/chat_history.db"
+# 旧版存储（仅用于首次迁移）
+LEGACY_HISTORY_FILE = "storage/chat_history.json"
+LEGACY_HISTORY_LOG_FILE = "storage/chat_history.jsonl"
 
 class Canvas(BaseModel):
     id: str
@@ -19,96 +43,144 @@ class Canvas(BaseModel):
     messages: List[Dict[str, Any]]
 
 class HistoryService:
+    """画布历史存储（SQLite + aiosqlite）
+
+    之前基于文件的实现每次变更都要重写/追加整个画布 JSON，且无法在多个
+    uvicorn worker 间安全共享。SQLite 提供：
+    - 按 id 的 O(log N) 点更新（INSERT OR REPLACE），成本与历史总量无关
+    - WAL 日志带来的崩溃安全和多进程并发访问
+    - aiosqlite 把所有 I/O 放到后台线程，不阻塞事件循环
+    payload 列存 orjson 编码后的画布 JSON（BLOB）。
+    """
+
     def __init__(self):
-        self.file_path = HISTORY_FILE
-        self._ensure_storage_dir()
-
-    def _ensure_storage_dir(self):
-        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-        if not os.path.exists(self.file_path):
-            self._save_data([])
-        else:
-            # 检查文件是否为空或格式错误，如果是则重置
+        self.db_path = HISTORY_DB_FILE
+        self._db: Optional[aiosqlite.Connection] = None
+        self._init_lock = asyncio.Lock()
+        # get_canvases 结果缓存：data_version 等价于旧文件实现里的 mtime 检查，
+        # 其他连接（多 worker）提交写入时会变化；本连接的写入在 save/delete 里显式失效
+        self._canvases_cache: Optional[List[Dict[str, Any]]] = None
+        self._cache_data_version: Optional[int] = None
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+    async def _get_db(self) -> aiosqlite.Connection:
+        """懒加载单例连接：建表、设置 PRAGMA，并在首次建库时迁移旧文件"""
+        if self._db is not None:
+            return self._db
+        async with self._init_lock:
+            if self._db is not None:
+                return self._db
+            db = await aiosqlite.connect(self.db_path)
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.execute(
+                "CREATE TABLE IF NOT EXISTS canvases ("
+                "id TEXT PRIMARY KEY, payload BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            await db.commit()
+            await self._migrate_legacy(db)
+            self._db = db
+            return db
+
+    async def _migrate_legacy(self, db: aiosqlite.Connection):
+        """首次建库时从旧版 JSONL/JSON 文件导入（旧文件保留作为备份）"""
+        async with db.execute("SELECT COUNT(*) FROM canvases") as cursor:
+            (count,) = await cursor.fetchone()
+        if count:
+            return
+
+        # 旧文件可能很大，读取+解析放到工作线程，首个请求期间不阻塞事件循环
+        canvases = await anyio.to_thread.run_sync(self._load_legacy_canvases)
+        if not canvases:
+            return
+        for canvas in canvases:
+            await self._upsert(db, canvas)
+        await db.commit()
+        logger.info(f"已从旧版历史文件迁移 {len(canvases)} 个画布到 {self.db_path}")
+
+    def _load_legacy_canvases(self) -> List[Dict[str, Any]]:
+        """读取旧版 JSONL 操作日志或整文件 JSON（容忍损坏行/损坏文件）"""
+        index: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(LEGACY_HISTORY_LOG_FILE):
             try:
-                with open(self.file_path, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if not content:
-                        logger.warning("历史记录文件为空，重置为空列表")
-                        self._save_data([])
-                    else:
-                        # 尝试解析，如果失败会在 _load_data 中处理
-                        json.loads(content)
-            except (json.JSONDecodeError, Exception) as e:
-                logger.warning(f"初始化时发现历史记录文件格式错误: {e}，重置为空列表")
-                self._save_data([])
-
-    def _load_data(self) -> List[Dict[str, Any]]:
-        try:
-            if not os.path.exists(self.file_path):
-                return []
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                # 处理空文件或格式错误
-                if not content:
-                    logger.warning(f"历史记录文件为空，返回空列表")
-                    return []
-                return json.loads(content)
-        except json.JSONDecodeError as e:
-            logger.error(f"历史记录文件格式错误: {e}，尝试修复...")
-            # 如果文件损坏，备份并重置
+                with open(LEGACY_HISTORY_LOG_FILE, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            op = _json_loads(line)
+                        except ValueError:
+                            continue
+                        if op.get("op") == "put" and isinstance(op.get("canvas"), dict) and op["canvas"].get("id"):
+                            index[op["canvas"]["id"]] = op["canvas"]
+                        elif op.get("op") == "del":
+                            index.pop(op.get("id"), None)
+            except Exception as e:
+                logger.warning(f"读取旧版历史日志失败: {e}")
+        elif os.path.exists(LEGACY_HISTORY_FILE):
             try:
-                backup_path = self.file_path + '.backup'
-                if os.path.exists(self.file_path):
-                    import shutil
-                    shutil.copy2(self.file_path, backup_path)
-                    logger.info(f"已备份损坏文件到: {backup_path}")
-                # 重置为空列表
-                self._save_data([])
-                return []
-            except Exception as backup_error:
-                logger.error(f"备份文件失败: {backup_error}")
-                return []
-        except Exception as e:
-            logger.error(f"加载历史记录失败: {e}")
-            return []
-
-    def _save_data(self, data: List[Dict[str, Any]]):
+                with open(LEGACY_HISTORY_FILE, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+                data = _json_loads(content) if content else []
+                if isinstance(data, list):
+                    for c in data:
+                        if isinstance(c, dict) and c.get('id'):
+                            index[c['id']] = c
+            except Exception as e:
+                logger.warning(f"旧版历史记录文件格式错误: {e}，按空历史处理")
+        return list(index.values())
+
+    @staticmethod
+    async def _upsert(db: aiosqlite.Connection, canvas_data: Dict[str, Any]):
+        created_at = canvas_data.get("createdAt") or time.time() * 1000
+        await db.execute(
+            "INSERT OR REPLACE INTO canvases (id, payload, created_at) VALUES (?, ?, ?)",
+            (canvas_data["id"], _json_dumps(canvas_data), float(created_at)),
+        )
+
+    async def get_canvases(self) -> List[Dict[str, Any]]:
+        db = await self._get_db()
+        # 先查 data_version：未变化时直接返回缓存，省掉整表读取 + JSON 解析
+        async with db.execute("PRAGMA data_version") as cursor:
+            (version,) = await cursor.fetchone()
+        if self._canvases_cache is not None and version == self._cache_data_version:
+            return self._canvases_cache
+        async with db.execute("SELECT payload FROM canvases ORDER BY created_at DESC") as cursor:
+            rows = await cursor.fetchall()
+        self._canvases_cache = [_json_loads(payload) for (payload,) in rows]
+        self._cache_data_version = version
+        return self._canvases_cache
+
+    async def get_canvas(self, canvas_id: str) -> Optional[Dict[str, Any]]:
+        db = await self._get_db()
+        async with db.execute("SELECT payload FROM canvases WHERE id = ?", (canvas_id,)) as cursor:
+            row = await cursor.fetchone()
+        return _json_loads(row[0]) if row else None
+
+    async def save_canvas(self, canvas_data: Dict[str, Any]):
         try:
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            db = await self._get_db()
+            await self._upsert(db, canvas_data)
+            await db.commit()
+            # data_version 不反映本连接的写入，显式失效
+            self._canvases_cache = None
         except Exception as e:
             logger.error(f"保存历史记录失败: {e}")
-
-    def get_canvases(self) -> List[Dict[str, Any]]:
-        return self._load_data()
-
-    def save_canvas(self, canvas_data: Dict[str, Any]):
-        canvases = self._load_data()
-        # 查找是否存在
-        index = -1
-        for i, c in enumerate(canvases):
-            if c.get('id') == canvas_data.get('id'):
-                index = i
-                break
-        
-        if index >= 0:
-            canvases[index] = canvas_data
-        else:
-            canvases.insert(0, canvas_data) # 新的在前面
-            
-        self._save_data(canvases)
         return canvas_data
 
-    def delete_canvas(self, canvas_id: str):
-        canvases = self._load_data()
-        canvases = [c for c in canvases if c.get('id') != canvas_id]
-        self._save_data(canvases)
+    async def delete_canvas(self, canvas_id: str):
+        db = await self._get_db()
+        await db.execute("DELETE FROM canvases WHERE id = ?", (canvas_id,))
+        await db.commit()
+        # data_version 不反映本连接的写入，显式失效
+        self._canvases_cache = None
         return True
 
-history_service = HistoryService()
-
-
-
-
-
+    async def close(self):
+        """关闭数据库连接（应用关停时调用）"""
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
 
+history_service = HistoryService()
@@ -166,6 +166,11 @@ def set_skill_enabled(skill_id: str, enabled: bool) -> None:
     data["installedSkills"] = installed
     _save_settings_atomic(data)
 
+    # skill 开关影响注入提示词的 skills_context，清掉缓存的 Agent
+    # （函数内导入：agent_service 在模块级依赖本模块，避免循环导入）
+    from app.services import agent_service
+    agent_service.invalidate_agent()
+
 
 def get_skills_context() -> str:
     """
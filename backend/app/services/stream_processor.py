@@ -1,6 +1,7 @@
 """
-流式处理器 - 处理LangGraph的流式输出并转换为SSE格式
+流式处理器 - 处理LangGraph的流式输出并转换为SSE事件
 """
+import asyncio
 import json
 import logging
 import os
@@ -17,6 +18,20 @@ from langchain_core.messages import (
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# OpenAI 格式 role -> LangChain 消息类（一次遍历即可完成整段历史的转换）
+_ROLE_TO_MESSAGE = {"user": HumanMessage, "assistant": AIMessage}
+
+# SSE 事件序列化是流式路径上最热的编码点（每个 token 一次）
+# 优先使用 orjson（C 实现），不可用时回退到标准库
+try:
+    import orjson
+
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:  # pragma: no cover
+    def json_dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
 
 class StreamProcessor:
     """流式处理器 - 负责处理智能体的流式输出"""
@@ -30,8 +45,109 @@ class StreamProcessor:
         self.tool_call_names: Dict[str, str] = {}  # 用于存储工具调用名称（key: tool_call_id, value: tool_name）
         self.tool_call_args_buffer: Dict[str, str] = {}  # 用于累积参数JSON字符串（key: tool_call_id, value: 累积的JSON字符串）
         self.skill_matched_emitted: set = set()  # 已发送过 skill_matched 事件的 tool_call_id 集合
+        self._last_emitted = 0  # values 模式下已下发的消息数量（增量转换用）
         # LangGraph 默认 recursion_limit=25，生成多张图会很容易超过这个步数导致报错
         self.recursion_limit = int(os.getenv("RECURSION_LIMIT", "200"))
+        # 按消息类型的精确分发表（比每个 chunk 走一串 isinstance 判断快）
+        self._dispatch = {
+            ToolMessage: self._handle_tool_message,
+            AIMessageChunk: self._handle_ai_chunk,
+        }
+
+    # delta 合并阈值：逐 token 输出会产生大量只有几个字符的事件帧，
+    # 在这个字符数/时间预算内先合并再下发，减少 JSON 编码和网络写的次数
+    DELTA_FLUSH_CHARS = 64
+    DELTA_FLUSH_SECONDS = 0.012
+
+    # astream 合并窗口：连续纯文本 chunk 最多合并的个数 / 等待下一个 chunk 的时间预算
+    MERGE_MAX_CHUNKS = 8
+    MERGE_WINDOW_SECONDS = 0.010
+
+    @staticmethod
+    def _mergeable_ai_chunk(chunk: Any):
+        """判断 chunk 是否为可合并的纯文本 AIMessageChunk messages 事件
+
+        可合并时返回 (message, metadata)，否则返回 None。
+        带工具调用（tool_calls / tool_call_chunks）的 chunk 不参与合并，
+        保证工具事件的时序不受影响。
+        """
+        if not (isinstance(chunk, tuple) and len(chunk) == 2 and chunk[0] == "messages"):
+            return None
+        data = chunk[1]
+        if not (isinstance(data, (tuple, list)) and data and type(data[0]) is AIMessageChunk):
+            return None
+        message = data[0]
+        if message.tool_calls or message.tool_call_chunks:
+            return None
+        if not isinstance(message.content, str) or not message.content:
+            return None
+        return message, (data[1] if len(data) > 1 else None)
+
+    async def _iter_coalesced(self, stream: Any) -> AsyncGenerator[Any, None]:
+        """把逐 token 的 astream 输出按短窗口合并后再下发
+
+        stream_mode=["messages"] 下每个 token 都会触发一次异步迭代和一整套
+        chunk 处理（类型分发、日志、事件构造）。这里最多等 MERGE_WINDOW_SECONDS
+        或攒满 MERGE_MAX_CHUNKS 个连续的纯文本 AIMessageChunk，利用 LangChain
+        支持的 chunk 相加合并成一个再处理；工具调用等其他 chunk 原样立即下发。
+        """
+        it = stream.__aiter__()
+        pending = None  # (已合并的 AIMessageChunk, metadata, 合并数量)
+        # __anext__ 的 future 跨窗口复用：wait_for 会在超时时取消 future，
+        # 把 CancelledError 抛进 astream 生成器并终结它（下一次迭代直接
+        # StopAsyncIteration，响应被截断）。asyncio.wait 超时不取消 future，
+        # 同一个 future 留到下一轮继续等。
+        next_fut = None
+        try:
+            while True:
+                if next_fut is None:
+                    next_fut = asyncio.ensure_future(it.__anext__())
+                if pending is None:
+                    try:
+                        chunk = await next_fut
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        next_fut = None
+                else:
+                    done, _ = await asyncio.wait({next_fut}, timeout=self.MERGE_WINDOW_SECONDS)
+                    if not done:
+                        # 窗口内没有新 chunk：先把已合并的下发；future 保留，回到阻塞等待
+                        message, metadata, _count = pending
+                        pending = None
+                        yield ("messages", (message, metadata))
+                        continue
+                    try:
+                        chunk = next_fut.result()
+                    except StopAsyncIteration:
+                        message, metadata, _count = pending
+                        yield ("messages", (message, metadata))
+                        return
+                    finally:
+                        next_fut = None
+                info = self._mergeable_ai_chunk(chunk)
+                if info is None:
+                    # 非纯文本 chunk：先冲刷待合并内容，保持顺序
+                    if pending is not None:
+                        message, metadata, _ = pending
+                        pending = None
+                        yield ("messages", (message, metadata))
+                    yield chunk
+                    continue
+                message, metadata = info
+                if pending is None:
+                    pending = (message, metadata, 1)
+                else:
+                    merged, first_metadata, count = pending
+                    pending = (merged + message, first_metadata, count + 1)
+                if pending[2] >= self.MERGE_MAX_CHUNKS:
+                    merged, first_metadata, _ = pending
+                    pending = None
+                    yield ("messages", (merged, first_metadata))
+        finally:
+            # 本生成器被提前关闭时，别把悬挂的 __anext__ 任务泄漏出去
+            if next_fut is not None:
+                next_fut.cancel()
 
     def _extract_skill_name(self, path: str) -> str:
         """从 skill 文件路径中提取 skill 目录名（ID）"""
@@ -59,7 +175,7 @@ class StreamProcessor:
             pass
         return skill_id
 
-    async def _maybe_emit_skill_matched(self, tool_name: str, tool_call_id: str, tool_args: dict) -> AsyncGenerator[str, None]:
+    async def _maybe_emit_skill_matched(self, tool_name: str, tool_call_id: str, tool_args: dict) -> AsyncGenerator[Dict[str, Any], None]:
         """如果是 read_skill_file 且尚未发送过，则发送 skill_matched 事件"""
         if tool_name == "read_skill_file" and tool_call_id not in self.skill_matched_emitted:
             skill_path = tool_args.get("path", "")
@@ -73,66 +189,89 @@ class StreamProcessor:
                     "tool_call_id": tool_call_id
                 }
                 self.skill_matched_emitted.add(tool_call_id)
-                yield f"data: {json.dumps(skill_event, ensure_ascii=False)}\n\n"
+                yield skill_event
 
     async def process_stream(
         self,
         agent: Any,
-        messages: List[Dict[str, Any]]
-    ) -> AsyncGenerator[str, None]:
+        history: List[Dict[str, Any]],
+        message: str
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         处理整个流式响应
-        
+
         Args:
             agent: 编译后的LangGraph Agent
-            messages: 消息列表
-        
+            history: 历史消息列表（OpenAI 格式字典）
+            message: 本轮用户消息
+
         Yields:
-            SSE格式的事件字符串
+            事件 payload 字典（SSE 封帧由响应层的 EventSourceResponse 完成）
         """
         try:
-            logger.info(f"🚀 开始处理流式响应，消息数量: {len(messages)}")
-            
-            # 转换消息格式为LangChain格式
-            langchain_messages = []
-            for msg in messages:
-                if msg.get("role") == "user":
-                    langchain_messages.append(HumanMessage(content=msg.get("content", "")))
-                elif msg.get("role") == "assistant":
-                    langchain_messages.append(AIMessage(content=msg.get("content", "")))
-            
+            logger.info(f"🚀 开始处理流式响应，历史消息数量: {len(history)}")
+
+            # 历史一次遍历直接构建 LangChain 消息（不 copy、不经过中间字典），
+            # 本轮用户消息最后追加
+            langchain_messages = [
+                _ROLE_TO_MESSAGE[role](content=msg.get("content", ""))
+                for msg in history
+                if (role := msg.get("role")) in _ROLE_TO_MESSAGE
+            ]
+            langchain_messages.append(HumanMessage(content=message))
+
             logger.info(f"📨 转换后的消息数量: {len(langchain_messages)}")
             
             # 开始流式处理 - 使用 messages 模式确保逐字符流式输出
-            # 关键：每个 chunk 立即 yield，不等待，类似 OpenAI 的流式输出
+            # delta 事件做短预算合并（DELTA_FLUSH_CHARS/DELTA_FLUSH_SECONDS），
+            # 非 delta 事件先冲刷缓冲再下发，保证顺序不变
+            loop = asyncio.get_running_loop()
+            delta_buffer = ""
+            last_flush = loop.time()
             chunk_count = 0
             try:
-                async for chunk in agent.astream(
+                # 逐 token 的 chunk 先经 _iter_coalesced 短窗口合并，降低每响应的迭代次数
+                async for chunk in self._iter_coalesced(agent.astream(
                     {"messages": langchain_messages},
                     {"recursion_limit": self.recursion_limit},
                     stream_mode=["messages"]  # 使用列表格式，确保1流式输出
-                ):
+                )):
                     chunk_count += 1
-                    logger.debug(f"📦 收到第 {chunk_count} 个 chunk: {type(chunk)}")
-                    # 立即处理并发送，不等待 - 确保真正的流式输出
+                    logger.debug("📦 收到第 %d 个 chunk: %s", chunk_count, type(chunk))
                     event_count = 0
                     try:
                         async for event in self._handle_chunk(chunk):
                             event_count += 1
-                            logger.debug(f"📤 发送第 {event_count} 个事件 (chunk {chunk_count}): {event[:100] if len(event) > 100 else event}")
-                            # 立即 yield，确保流式输出，不缓冲
-                            yield event
+                            logger.debug("📤 发送第 %d 个事件 (chunk %d): %s", event_count, chunk_count, event.get("type"))
+                            if event.get("type") == "delta":
+                                delta_buffer += event["content"]
+                                now = loop.time()
+                                if (len(delta_buffer) >= self.DELTA_FLUSH_CHARS
+                                        or now - last_flush > self.DELTA_FLUSH_SECONDS):
+                                    yield {"type": "delta", "content": delta_buffer}
+                                    delta_buffer = ""
+                                    last_flush = now
+                            else:
+                                if delta_buffer:
+                                    yield {"type": "delta", "content": delta_buffer}
+                                    delta_buffer = ""
+                                    last_flush = loop.time()
+                                yield event
                     except (GeneratorExit, StopAsyncIteration, ConnectionError, BrokenPipeError, OSError) as e:
                         # 客户端断开，停止处理
                         logger.info(f"⚠️ 客户端断开连接，停止处理 chunk: {type(e).__name__}")
                         raise  # 重新抛出，让上层处理
-                    logger.debug(f"✅ Chunk {chunk_count} 处理完成，发送了 {event_count} 个事件")
+                    logger.debug("✅ Chunk %d 处理完成，发送了 %d 个事件", chunk_count, event_count)
             except (GeneratorExit, StopAsyncIteration, ConnectionError, BrokenPipeError, OSError) as e:
                 # 客户端断开连接，停止 agent 处理
                 logger.info(f"ℹ️ 客户端断开连接，停止 agent 流式处理: {type(e).__name__}")
                 # 不继续处理，直接返回
                 return
 
+            # 冲刷最后一段未满阈值的 delta
+            if delta_buffer:
+                yield {"type": "delta", "content": delta_buffer}
+
             # 发送完成事件
             # 打印剩余的文本缓冲区
             if self.text_buffer:
@@ -140,30 +279,30 @@ class StreamProcessor:
                 self.text_buffer = ""
             
             logger.info("✅ 流式处理完成")
-            yield "data: [DONE]\n\n"
 
         except Exception as e:
             import traceback
             logger.error(f"❌ 流式处理错误: {str(e)}")
             logger.error(traceback.format_exc())
-            error_event = {
+            # traceback 只进日志，不随事件下发（避免把大段栈文本发给客户端）
+            yield {
                 "type": "error",
-                "error": str(e),
-                "traceback": traceback.format_exc()
+                "error": str(e)
             }
-            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
 
-    async def _handle_chunk(self, chunk: Any) -> AsyncGenerator[str, None]:
+    async def _handle_chunk(self, chunk: Any) -> AsyncGenerator[Dict[str, Any], None]:
         """处理单个chunk"""
         try:
-            logger.debug(f"🔍 处理 chunk: type={type(chunk)}, value={str(chunk)[:200]}")
+            # str(chunk) 会序列化整个消息体，只在 DEBUG 级别真正开启时才计算
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔍 处理 chunk: type=%s, value=%s", type(chunk), str(chunk)[:200])
             
             # langgraph 1.0.0 的流式输出格式可能是多种形式
             # 1. tuple 格式: (chunk_type, chunk_data)
             if isinstance(chunk, tuple) and len(chunk) == 2:
                 chunk_type = chunk[0]
                 chunk_data = chunk[1]
-                logger.debug(f"  📦 Tuple chunk: type={chunk_type}, data_type={type(chunk_data)}")
+                logger.debug("  📦 Tuple chunk: type=%s, data_type=%s", chunk_type, type(chunk_data))
                 
                 if chunk_type == "values":
                     # 处理完整状态更新
@@ -172,270 +311,264 @@ class StreamProcessor:
                 else:
                     # 处理消息流
                     if isinstance(chunk_data, list) and len(chunk_data) > 0:
-                        logger.debug(f"  📋 消息列表，长度: {len(chunk_data)}")
+                        logger.debug("  📋 消息列表，长度: %d", len(chunk_data))
                         for message in chunk_data:
                             async for event in self._handle_message_chunk(message):
                                 yield event
                     elif hasattr(chunk_data, '__iter__') and not isinstance(chunk_data, str):
                         # 可迭代对象
-                        logger.debug(f"  🔄 可迭代对象")
+                        logger.debug("  🔄 可迭代对象")
                         for message in chunk_data:
                             async for event in self._handle_message_chunk(message):
                                 yield event
                     else:
                         # 单个消息对象
-                        logger.debug(f"  📨 单个消息对象")
+                        logger.debug("  📨 单个消息对象")
                         async for event in self._handle_message_chunk(chunk_data):
                             yield event
             # 2. 列表格式: [message1, message2, ...]
             elif isinstance(chunk, list) and len(chunk) > 0:
-                logger.debug(f"  📋 直接列表格式，长度: {len(chunk)}")
+                logger.debug("  📋 直接列表格式，长度: %d", len(chunk))
                 for message in chunk:
                     async for event in self._handle_message_chunk(message):
                         yield event
             # 3. 直接是消息对象
             else:
-                logger.debug(f"  📨 直接消息对象")
+                logger.debug("  📨 直接消息对象")
                 async for event in self._handle_message_chunk(chunk):
                     yield event
         except Exception as e:
             import traceback
             logger.error(f"❌ 处理 chunk 时出错: {str(e)}")
             logger.error(traceback.format_exc())
-            error_event = {
+            yield {
                 "type": "error",
                 "error": f"处理chunk时出错: {str(e)}"
             }
-            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
 
-    async def _handle_values_chunk(self, chunk_data: Dict[str, Any]) -> AsyncGenerator[str, None]:
-        """处理values类型的chunk - 包含完整消息状态"""
+    async def _handle_values_chunk(self, chunk_data: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """处理values类型的chunk - 包含完整消息状态
+
+        values chunk 携带整个会话状态，如果每次都 convert_to_openai_messages
+        全量转换，单次成本是 O(历史长度)，长对话下会二次方增长。
+        这里只转换上次下发之后新增的尾部消息，客户端按增量合并。
+        """
         all_messages = chunk_data.get("messages", [])
-        
-        if all_messages:
-            # 转换为OpenAI格式
-            oai_messages = convert_to_openai_messages(all_messages)
-            
-            # 发送完整消息更新
-            event = {
-                "type": "messages",
-                "messages": oai_messages
+
+        new_messages = all_messages[self._last_emitted:]
+        if new_messages:
+            self._last_emitted = len(all_messages)
+            # 只转换新增尾部，发送增量更新
+            yield {
+                "type": "messages_delta",
+                "messages": convert_to_openai_messages(new_messages)
             }
-            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
 
-    async def _handle_message_chunk(self, message_chunk: Any) -> AsyncGenerator[str, None]:
-        """处理消息类型的chunk"""
-        try:
-            # 处理工具消息
+    async def _handle_message_chunk(self, message_chunk: Any) -> AsyncGenerator[Dict[str, Any], None]:
+        """处理消息类型的chunk
+
+        热路径上每个 token 都要过一遍类型判断：先用 type() 做字典精确分发，
+        只有未命中（子类实例）时才回退到较慢的 isinstance 检查
+        """
+        handler = self._dispatch.get(type(message_chunk))
+        if handler is None:
+            # 子类兜底
             if isinstance(message_chunk, ToolMessage):
-                logger.info(f"🔧 工具调用结果: tool_call_id={message_chunk.tool_call_id}")
-                logger.info(f"   内容: {str(message_chunk.content)[:200]}")
-                # 清理已完成的工具调用参数和名称
-                if message_chunk.tool_call_id in self.tool_call_args:
-                    del self.tool_call_args[message_chunk.tool_call_id]
-                if message_chunk.tool_call_id in self.tool_call_names:
-                    del self.tool_call_names[message_chunk.tool_call_id]
-                event = {
-                    "type": "tool_result",
-                    "tool_call_id": message_chunk.tool_call_id,
-                    "content": message_chunk.content
-                }
-                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                handler = self._handle_tool_message
+            elif isinstance(message_chunk, AIMessageChunk):
+                handler = self._handle_ai_chunk
+            else:
                 return
+        try:
+            async for event in handler(message_chunk):
+                yield event
+        except Exception as e:
+            logger.error(f"❌ 处理消息chunk时出错: {str(e)}")
+            import traceback
+            logger.error(traceback.format_exc())
+            yield {
+                "type": "error",
+                "error": f"处理消息chunk时出错: {str(e)}"
+            }
+
+    async def _handle_tool_message(self, message_chunk: ToolMessage) -> AsyncGenerator[Dict[str, Any], None]:
+        """处理工具消息"""
+        logger.info(f"🔧 工具调用结果: tool_call_id={message_chunk.tool_call_id}")
+        logger.info(f"   内容: {str(message_chunk.content)[:200]}")
+        # 清理已完成的工具调用参数和名称
+        if message_chunk.tool_call_id in self.tool_call_args:
+            del self.tool_call_args[message_chunk.tool_call_id]
+        if message_chunk.tool_call_id in self.tool_call_names:
+            del self.tool_call_names[message_chunk.tool_call_id]
+        yield {
+            "type": "tool_result",
+            "tool_call_id": message_chunk.tool_call_id,
+            "content": message_chunk.content
+        }
 
-            # 处理AI消息
-            if isinstance(message_chunk, AIMessageChunk):
-                logger.debug(f"  🤖 AIMessageChunk: content={str(message_chunk.content)[:50] if message_chunk.content else None}")
-                # 处理文本内容 - 立即发送每个 chunk，类似 OpenAI 流式输出
-                # 关键：langgraph 的 AIMessageChunk 已经是增量内容，直接发送
-                content = message_chunk.content
+    async def _handle_ai_chunk(self, message_chunk: AIMessageChunk) -> AsyncGenerator[Dict[str, Any], None]:
+        """处理AI消息chunk（文本增量 + 工具调用）"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("  🤖 AIMessageChunk: content=%s",
+                         str(message_chunk.content)[:50] if message_chunk.content else None)
+        # 处理文本内容 - 立即发送每个 chunk，类似 OpenAI 流式输出
+        # 关键：langgraph 的 AIMessageChunk 已经是增量内容，直接发送
+        content = message_chunk.content
+        
+        # 如果 content 存在，立即发送（每个 chunk 都是增量）
+        if content is not None and content != "":
+            content_str = str(content) if not isinstance(content, str) else content
+            
+            # 直接发送这个 chunk 的内容（langgraph 已经处理了增量）
+            # 类似 OpenAI: chunk.choices[0].delta.content
+            if content_str:
+                logger.debug("📝 发送文本 delta (%d 字符): %s", len(content_str), content_str[:100])
                 
-                # 如果 content 存在，立即发送（每个 chunk 都是增量）
-                if content is not None and content != "":
-                    content_str = str(content) if not isinstance(content, str) else content
+                # 累积到缓冲区用于日志打印
+                self.text_buffer += content_str
+                # 如果遇到换行符或标点符号，且长度足够，则打印
+                if "\n" in self.text_buffer or (len(self.text_buffer) > 50 and any(p in self.text_buffer for p in "。！？.!?")):
+                    # 移除换行符，保持日志整洁
+                    log_content = self.text_buffer.replace("\n", " ")
+                    if log_content.strip():
+                        logger.info(f"🤖 AI回答: {log_content}")
+                    self.text_buffer = ""
                     
-                    # 直接发送这个 chunk 的内容（langgraph 已经处理了增量）
-                    # 类似 OpenAI: chunk.choices[0].delta.content
-                    if content_str:
-                        logger.debug(f"📝 发送文本 delta ({len(content_str)} 字符): {content_str[:100]}")
-                        
-                        # 累积到缓冲区用于日志打印
-                        self.text_buffer += content_str
-                        # 如果遇到换行符或标点符号，且长度足够，则打印
-                        if "\n" in self.text_buffer or (len(self.text_buffer) > 50 and any(p in self.text_buffer for p in "。！？.!?")):
-                            # 移除换行符，保持日志整洁
-                            log_content = self.text_buffer.replace("\n", " ")
-                            if log_content.strip():
-                                logger.info(f"🤖 AI回答: {log_content}")
-                            self.text_buffer = ""
-                            
-                        event = {
-                            "type": "delta",
-                            "content": content_str
-                        }
-                        # 立即 yield，不等待
-                        event_str = f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
-                        logger.debug(f"📤 发送事件字符串: {event_str[:100]}")
-                        yield event_str
+                # 立即 yield，不等待
+                yield {
+                    "type": "delta",
+                    "content": content_str
+                }
+        else:
+            logger.debug("  ⚠️  AIMessageChunk 没有内容")
+
+        # 处理工具调用
+        if hasattr(message_chunk, "tool_calls") and message_chunk.tool_calls:
+            for tool_call in message_chunk.tool_calls:
+                # 处理不同的工具调用格式
+                if isinstance(tool_call, dict):
+                    tool_call_id = tool_call.get("id")
+                    tool_name = tool_call.get("name")
+                    # 尝试多种可能的参数字段名
+                    tool_args = tool_call.get("args") or tool_call.get("arguments") or {}
+                    logger.debug("📋 字典格式工具调用: id=%s, name=%s, args=%s, args类型=%s", tool_call_id, tool_name, tool_args, type(tool_args))
                 else:
-                    logger.debug(f"  ⚠️  AIMessageChunk 没有内容")
-
-                # 处理工具调用
-                if hasattr(message_chunk, "tool_calls") and message_chunk.tool_calls:
-                    for tool_call in message_chunk.tool_calls:
-                        # 处理不同的工具调用格式
-                        if isinstance(tool_call, dict):
-                            tool_call_id = tool_call.get("id")
-                            tool_name = tool_call.get("name")
-                            # 尝试多种可能的参数字段名
-                            tool_args = tool_call.get("args") or tool_call.get("arguments") or {}
-                            logger.debug(f"📋 字典格式工具调用: id={tool_call_id}, name={tool_name}, args={tool_args}, args类型={type(tool_args)}")
+                    # ToolCall 对象
+                    tool_call_id = getattr(tool_call, "id", None)
+                    tool_name = getattr(tool_call, "name", None)
+                    # 尝试多种可能的参数属性名
+                    tool_args = getattr(tool_call, "args", None) or getattr(tool_call, "arguments", None)
+                    if tool_args is None:
+                        # 尝试通过 dict() 方法获取
+                        if hasattr(tool_call, "dict"):
+                            tool_dict = tool_call.dict()
+                            tool_args = tool_dict.get("args") or tool_dict.get("arguments") or {}
+                            logger.debug("📋 通过dict()获取参数: %s", tool_args)
                         else:
-                            # ToolCall 对象
-                            tool_call_id = getattr(tool_call, "id", None)
-                            tool_name = getattr(tool_call, "name", None)
-                            # 尝试多种可能的参数属性名
-                            tool_args = getattr(tool_call, "args", None) or getattr(tool_call, "arguments", None)
-                            if tool_args is None:
-                                # 尝试通过 dict() 方法获取
-                                if hasattr(tool_call, "dict"):
-                                    tool_dict = tool_call.dict()
-                                    tool_args = tool_dict.get("args") or tool_dict.get("arguments") or {}
-                                    logger.debug(f"📋 通过dict()获取参数: {tool_args}")
-                                else:
-                                    tool_args = {}
-                            logger.debug(f"📋 对象格式工具调用: id={tool_call_id}, name={tool_name}, args={tool_args}, args类型={type(tool_args)}, 对象类型={type(tool_call)}")
-                        
-                        # 关键修复：严格检查 name 是否存在且非空
-                        # 在流式输出中，某些 chunk 可能包含 name 为空或 None 的 tool_call
-                        if not tool_name or not tool_call_id:
-                            logger.debug(f"⚠️  跳过无效的工具调用 (name或id为空): name={tool_name}, id={tool_call_id}")
-                            continue
-                        
-                        # 存储工具调用名称（用于后续在tool_call_chunks中获取）
-                        if tool_name:
-                            self.tool_call_names[tool_call_id] = tool_name
-
-                        # 处理参数：如果是字符串（JSON格式），需要解析
-                        if isinstance(tool_args, str):
-                            try:
-                                tool_args = json.loads(tool_args)
-                                logger.debug(f"✅ 成功解析JSON参数: {tool_args}")
-                            except json.JSONDecodeError as e:
-                                logger.warning(f"⚠️  工具参数不是有效的JSON，使用空字典: {tool_args}, 错误: {e}")
-                                tool_args = {}
-                        elif tool_args is None:
                             tool_args = {}
-                            logger.debug(f"⚠️  工具参数为None，使用空字典")
+                    logger.debug("📋 对象格式工具调用: id=%s, name=%s, args=%s, args类型=%s, 对象类型=%s", tool_call_id, tool_name, tool_args, type(tool_args), type(tool_call))
+                
+                # 关键修复：严格检查 name 是否存在且非空
+                # 在流式输出中，某些 chunk 可能包含 name 为空或 None 的 tool_call
+                if not tool_name or not tool_call_id:
+                    logger.debug("⚠️  跳过无效的工具调用 (name或id为空): name=%s, id=%s", tool_name, tool_call_id)
+                    continue
+                
+                # 存储工具调用名称（用于后续在tool_call_chunks中获取）
+                if tool_name:
+                    self.tool_call_names[tool_call_id] = tool_name
 
-                        # 累积工具调用参数（流式输出中参数可能分多个chunk）
-                        if tool_call_id not in self.tool_call_args:
-                            self.tool_call_args[tool_call_id] = {}
-                        
-                        # 合并参数（后续chunk可能包含更多参数）
-                        if tool_args and isinstance(tool_args, dict):
-                            self.tool_call_args[tool_call_id].update(tool_args)
-                            logger.debug(f"✅ 从tool_calls累积参数: id={tool_call_id}, 新参数={tool_args}, 累积后={self.tool_call_args[tool_call_id]}")
-                        
-                        # 使用累积的参数
-                        final_args = self.tool_call_args[tool_call_id]
+                # 处理参数：如果是字符串（JSON格式），需要解析
+                if isinstance(tool_args, str):
+                    try:
+                        tool_args = json.loads(tool_args)
+                        logger.debug("✅ 成功解析JSON参数: %s", tool_args)
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"⚠️  工具参数不是有效的JSON，使用空字典: {tool_args}, 错误: {e}")
+                        tool_args = {}
+                elif tool_args is None:
+                    tool_args = {}
+                    logger.debug("⚠️  工具参数为None，使用空字典")
 
-                        # 只有当参数非空时才输出工具调用事件
-                        # 避免在流式传输中发送多次相同的工具调用（参数空 -> 参数完整）
-                        # 参数会在 tool_call_chunks 处理完成后统一发送
-                        if final_args:
-                            logger.info(f"🛠️  工具调用: name={tool_name}, id={tool_call_id}")
-                            logger.info(f"   参数: {final_args}")
+                # 累积工具调用参数（流式输出中参数可能分多个chunk）
+                if tool_call_id not in self.tool_call_args:
+                    self.tool_call_args[tool_call_id] = {}
+                
+                # 合并参数（后续chunk可能包含更多参数）
+                if tool_args and isinstance(tool_args, dict):
+                    self.tool_call_args[tool_call_id].update(tool_args)
+                    logger.debug("✅ 从tool_calls累积参数: id=%s, 新参数=%s, 累积后=%s", tool_call_id, tool_args, self.tool_call_args[tool_call_id])
+                
+                # 使用累积的参数
+                final_args = self.tool_call_args[tool_call_id]
 
-                            # 如果是 read_skill_file，先发送 skill_matched 事件
-                            async for ev in self._maybe_emit_skill_matched(tool_name, tool_call_id, final_args):
-                                yield ev
+                # 只有当参数非空时才输出工具调用事件
+                # 避免在流式传输中发送多次相同的工具调用（参数空 -> 参数完整）
+                # 参数会在 tool_call_chunks 处理完成后统一发送
+                if final_args:
+                    logger.info(f"🛠️  工具调用: name={tool_name}, id={tool_call_id}")
+                    logger.info(f"   参数: {final_args}")
 
-                            event = {
-                                "type": "tool_call",
-                                "id": tool_call_id,
-                                "name": tool_name,
-                                "arguments": final_args
-                            }
-                            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
-                        else:
-                            logger.debug(f"⏳ 工具调用参数为空，等待后续chunk补充: name={tool_name}, id={tool_call_id}")
-                
-                # 处理工具调用参数流（如果存在）
-                if hasattr(message_chunk, "tool_call_chunks") and message_chunk.tool_call_chunks:
-                    for tool_call_chunk in message_chunk.tool_call_chunks:
-                        # 处理可能的字典或对象
-                        chunk_dict = tool_call_chunk
-                        if not isinstance(chunk_dict, dict):
-                            # 尝试转为字典
-                            if hasattr(tool_call_chunk, "dict"):
-                                chunk_dict = tool_call_chunk.dict()
-                            else:
-                                chunk_dict = {"args": str(tool_call_chunk)} # fallback
+                    # 如果是 read_skill_file，先发送 skill_matched 事件
+                    async for ev in self._maybe_emit_skill_matched(tool_name, tool_call_id, final_args):
+                        yield ev
 
-                        # 提取信息
-                        args_chunk = chunk_dict.get("args")
-                        index = chunk_dict.get("index", 0)
-                        tc_id = chunk_dict.get("id")
-                        tool_name_from_chunk = chunk_dict.get("name")
-                        
-                        # 如果 chunk 中没有 id，尝试从 tool_call_names 中查找（通过 index）
-                        # 或者使用最近创建的 tool_call_id
-                        if not tc_id:
-                            # 尝试从已存储的 tool_call_names 中获取（如果有多个，使用最后一个）
-                            if self.tool_call_names:
-                                # 使用最近添加的 tool_call_id（假设 index=0 对应最新的）
-                                tc_id = list(self.tool_call_names.keys())[-1] if self.tool_call_names else None
-                                logger.debug(f"⚠️  chunk中没有id，使用最近的tool_call_id: {tc_id}")
+                    yield {
+                        "type": "tool_call",
+                        "id": tool_call_id,
+                        "name": tool_name,
+                        "arguments": final_args
+                    }
+                else:
+                    logger.debug("⏳ 工具调用参数为空，等待后续chunk补充: name=%s, id=%s", tool_name, tool_call_id)
+        
+        # 处理工具调用参数流（如果存在）
+        if hasattr(message_chunk, "tool_call_chunks") and message_chunk.tool_call_chunks:
+            for tool_call_chunk in message_chunk.tool_call_chunks:
+                # 处理可能的字典或对象
+                chunk_dict = tool_call_chunk
+                if not isinstance(chunk_dict, dict):
+                    # 尝试转为字典
+                    if hasattr(tool_call_chunk, "dict"):
+                        chunk_dict = tool_call_chunk.dict()
+                    else:
+                        chunk_dict = {"args": str(tool_call_chunk)} # fallback
+
+                # 提取信息
+                args_chunk = chunk_dict.get("args")
+                index = chunk_dict.get("index", 0)
+                tc_id = chunk_dict.get("id")
+                tool_name_from_chunk = chunk_dict.get("name")
+                
+                # 如果 chunk 中没有 id，尝试从 tool_call_names 中查找（通过 index）
+                # 或者使用最近创建的 tool_call_id
+                if not tc_id:
+                    # 尝试从已存储的 tool_call_names 中获取（如果有多个，使用最后一个）
+                    if self.tool_call_names:
+                        # 使用最近添加的 tool_call_id（假设 index=0 对应最新的）
+                        tc_id = list(self.tool_call_names.keys())[-1] if self.tool_call_names else None
+                        logger.debug("⚠️  chunk中没有id，使用最近的tool_call_id: %s", tc_id)
+                
+                # 累积参数JSON字符串片段
+                if args_chunk and tc_id:
+                    # 初始化缓冲区
+                    if tc_id not in self.tool_call_args_buffer:
+                        self.tool_call_args_buffer[tc_id] = ""
+                    
+                    # 累积字符串片段
+                    if isinstance(args_chunk, str):
+                        self.tool_call_args_buffer[tc_id] += args_chunk
                         
-                        # 累积参数JSON字符串片段
-                        if args_chunk and tc_id:
-                            # 初始化缓冲区
-                            if tc_id not in self.tool_call_args_buffer:
-                                self.tool_call_args_buffer[tc_id] = ""
-                            
-                            # 累积字符串片段
-                            if isinstance(args_chunk, str):
-                                self.tool_call_args_buffer[tc_id] += args_chunk
-                                
-                                # 尝试解析累积的JSON字符串
-                                try:
-                                    parsed_args = json.loads(self.tool_call_args_buffer[tc_id])
-                                    if isinstance(parsed_args, dict):
-                                        # 解析成功，更新参数
-                                        if tc_id not in self.tool_call_args:
-                                            self.tool_call_args[tc_id] = {}
-                                        self.tool_call_args[tc_id].update(parsed_args)
-                                        
-                                        # 查找工具名称
-                                        tool_name_from_storage = self.tool_call_names.get(tc_id)
-                                        tool_name = tool_name_from_storage or tool_name_from_chunk
-                                        
-                                        if tool_name:
-                                            logger.info(f"🛠️  工具调用（参数更新）: name={tool_name}, id={tc_id}")
-                                            logger.info(f"   参数: {self.tool_call_args[tc_id]}")
-
-                                            # 如果是 read_skill_file，先发送 skill_matched 事件
-                                            async for ev in self._maybe_emit_skill_matched(tool_name, tc_id, self.tool_call_args[tc_id]):
-                                                yield ev
-
-                                            # 发送更新后的工具调用事件（包含完整参数）
-                                            event = {
-                                                "type": "tool_call",
-                                                "id": tc_id,
-                                                "name": tool_name,
-                                                "arguments": self.tool_call_args[tc_id]
-                                            }
-                                            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
-                                except json.JSONDecodeError:
-                                    # JSON 还不完整，继续累积
-                                    pass
-                            elif isinstance(args_chunk, dict):
-                                # 如果已经是字典，直接更新
+                        # 尝试解析累积的JSON字符串
+                        try:
+                            parsed_args = json.loads(self.tool_call_args_buffer[tc_id])
+                            if isinstance(parsed_args, dict):
+                                # 解析成功，更新参数
                                 if tc_id not in self.tool_call_args:
                                     self.tool_call_args[tc_id] = {}
-                                self.tool_call_args[tc_id].update(args_chunk)
+                                self.tool_call_args[tc_id].update(parsed_args)
                                 
+                                # 查找工具名称
                                 tool_name_from_storage = self.tool_call_names.get(tc_id)
                                 tool_name = tool_name_from_storage or tool_name_from_chunk
                                 
@@ -447,31 +580,46 @@ class StreamProcessor:
                                     async for ev in self._maybe_emit_skill_matched(tool_name, tc_id, self.tool_call_args[tc_id]):
                                         yield ev
 
-                                    event = {
+                                    # 发送更新后的工具调用事件（包含完整参数）
+                                    yield {
                                         "type": "tool_call",
                                         "id": tc_id,
                                         "name": tool_name,
                                         "arguments": self.tool_call_args[tc_id]
                                     }
-                                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                        except json.JSONDecodeError:
+                            # JSON 还不完整，继续累积
+                            pass
+                    elif isinstance(args_chunk, dict):
+                        # 如果已经是字典，直接更新
+                        if tc_id not in self.tool_call_args:
+                            self.tool_call_args[tc_id] = {}
+                        self.tool_call_args[tc_id].update(args_chunk)
+                        
+                        tool_name_from_storage = self.tool_call_names.get(tc_id)
+                        tool_name = tool_name_from_storage or tool_name_from_chunk
                         
-                        # 发送参数流事件给前端（用于实时显示参数输入，可选）
-                        # 注释掉以减少日志噪音
-                        # if args_chunk:
-                        #     event = {
-                        #         "type": "tool_call_chunk",
-                        #         "index": index,
-                        #         "id": tc_id,
-                        #         "args": args_chunk
-                        #     }
-                        #     yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                        if tool_name:
+                            logger.info(f"🛠️  工具调用（参数更新）: name={tool_name}, id={tc_id}")
+                            logger.info(f"   参数: {self.tool_call_args[tc_id]}")
 
-        except Exception as e:
-            logger.error(f"❌ 处理消息chunk时出错: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            error_event = {
-                "type": "error",
-                "error": f"处理消息chunk时出错: {str(e)}"
-            }
-            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
+                            # 如果是 read_skill_file，先发送 skill_matched 事件
+                            async for ev in self._maybe_emit_skill_matched(tool_name, tc_id, self.tool_call_args[tc_id]):
+                                yield ev
+
+                            yield {
+                                "type": "tool_call",
+                                "id": tc_id,
+                                "name": tool_name,
+                                "arguments": self.tool_call_args[tc_id]
+                            }
+                
+                # 发送参数流事件给前端（用于实时显示参数输入，可选）
+                # 注释掉以减少日志噪音
+                # if args_chunk:
+                #     yield {
+                #         "type": "tool_call_chunk",
+                #         "index": index,
+                #         "id": tc_id,
+                #         "args": args_chunk
+                #     }
@@ -129,6 +129,11 @@ def save_workspace_file(filename: str, content: str) -> None:
     (workspace_dir / filename).write_text(content, encoding="utf-8")
     logger.info(f"💾 保存工作空间文件: {filename} ({len(content)} 字符)")
 
+    # 工作空间文件注入提示词的 workspace_context，清掉缓存的 Agent
+    # （write_memory 工具和设置页编辑器都经由本函数保存）
+    from app.services import agent_service
+    agent_service.invalidate_agent()
+
 
 def _truncate(content: str) -> str:
     """超出 _MAX_CHARS 时截断，保留头 70% + 尾 20%"""
@@ -1,14 +1,21 @@
 """
 图像生成工具 - 使用 SiliconFlow API 生成图像
 """
+import asyncio
+import hashlib
 import json
 import logging
 import os
-import requests
-import uuid
-from datetime import datetime
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Optional
 from urllib.parse import urlparse
+import aiofiles
+import httpx
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
@@ -39,6 +46,13 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.siliconflow.cn/v1").
 IMAGE_MODEL_NAME = os.getenv("IMAGE_MODEL_NAME", "Qwen/Qwen-Image").strip()
 EDIT_IMAGE_MODEL_NAME = os.getenv("EDIT_IMAGE_MODEL_NAME", "Qwen/Qwen-Image-Edit-2509").strip()
 
+# API 端点与鉴权头是进程内不变量，导入时固化，省掉每次调用的字符串拼接和字典分配
+GENERATIONS_URL = f"{OPENAI_BASE_URL.rstrip('/')}/images/generations"
+API_HEADERS = {
+    "Authorization": f"Bearer {OPENAI_API_KEY}",
+    "Content-Type": "application/json",
+}
+
 # 图片存储目录
 # BASE_DIR 已在上方定义
 STORAGE_DIR = BASE_DIR / "storage"
@@ -47,112 +61,398 @@ IMAGES_DIR = STORAGE_DIR / "images"
 # 确保图片存储目录存在
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
+# 提前持有 images 目录的 dirfd：写文件走 openat，内核免去每次保存时
+# 对 BASE_DIR/storage/images 三级路径的重复解析（fork 出的归一化子进程会继承/重建）
+try:
+    _IMAGES_DIR_FD: Optional[int] = os.open(
+        str(IMAGES_DIR), os.O_DIRECTORY | getattr(os, "O_CLOEXEC", 0)
+    )
+except OSError:  # pragma: no cover
+    _IMAGES_DIR_FD = None
+
+
+def _open_image_for_write(filename: str):
+    """在 images 目录内创建文件：优先 openat(dirfd)，不可用时退回普通 open"""
+    if _IMAGES_DIR_FD is not None:
+        fd = os.open(
+            filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, dir_fd=_IMAGES_DIR_FD
+        )
+        return os.fdopen(fd, "wb")
+    return open(IMAGES_DIR / filename, "wb")
+
+# 下载分块大小：64KiB 边收边写盘，内存占用与图片大小无关
+DOWNLOAD_CHUNK_SIZE = 65536
+
+# 文件名清理：只保留 ASCII 安全字符 [A-Za-z0-9 _-]。
+# 先 encode("ascii","ignore") 丢掉非 ASCII（中文提示词直接走无 safe_prompt 的命名分支），
+# 再用 256 字节删除表做 bytes.translate 单遍 C 层扫描，零 Python 级逐字符判断
+_ASCII_DELETE = bytes(
+    c for c in range(128) if not (chr(c).isalnum() or chr(c) in " -_")
+)
+
+# JPEG 保存参数：optimize 触发第二遍 Huffman 统计、progressive 触发多扫描脚本，
+# 对只在浏览器里看一次的生成图是纯延迟开销，默认关闭（体积增幅 <5%），
+# 需要最小体积时设 IMAGE_SAVE_OPTIMIZE=1
+JPEG_SAVE_QUALITY = int(os.getenv("IMAGE_SAVE_QUALITY", "90"))
+JPEG_SAVE_OPTIMIZE = os.getenv("IMAGE_SAVE_OPTIMIZE", "0") == "1"
+
+# PNG 压缩级别：Pillow 默认 optimize 走 zlib level 9 + 滤波器选择，是最慢的编码路径；
+# 对一次性的模型产物用 level 1（1024² RGBA 约 7-10 倍提速，体积略增）
+PNG_COMPRESS_LEVEL = int(os.getenv("PNG_COMPRESS_LEVEL", "1"))
+
+# numpy：alpha 检查等像素级归约走 SIMD 向量化路径（opencv-python 依赖自带）
+try:
+    import numpy as _np  # type: ignore
+except ImportError:  # pragma: no cover
+    _np = None  # type: ignore
+
+# 可选：libjpeg-turbo SIMD 编码（PyTurboJPEG，需系统安装 libturbojpeg），
+# 1024² RGB 编码约比 Pillow 的 libjpeg 路径快 2-4 倍；未安装时走 Pillow
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420  # type: ignore
+
+    _turbo_jpeg = TurboJPEG() if _np is not None else None
+except Exception:  # pragma: no cover
+    _turbo_jpeg = None
+
+
+def _save_jpeg(im, file_path) -> None:
+    """保存不透明图为 JPEG：优先 libjpeg-turbo，退回 Pillow"""
+    if _turbo_jpeg is not None:
+        try:
+            # pixel_format 默认是 TJPF_BGR（面向 OpenCV）；Pillow 数组是 RGB，必须显式指定
+            buf = _turbo_jpeg.encode(
+                _np.asarray(im), quality=JPEG_SAVE_QUALITY,
+                pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420,
+            )
+            with _open_image_for_write(os.path.basename(file_path)) as f:
+                f.write(buf)
+            return
+        except Exception as e:
+            logger.debug("turbojpeg 编码失败，回退 Pillow: %s", e)
+    im.save(
+        file_path,
+        format="JPEG",
+        quality=JPEG_SAVE_QUALITY,
+        optimize=JPEG_SAVE_OPTIMIZE,
+        progressive=JPEG_SAVE_OPTIMIZE,
+    )
+
+# sRGB 目标 profile 在导入时创建一次；LCMS 变换按 (源ICC哈希, 模式) 缓存。
+# 构建变换（gamma 表、CLUT 预计算）是毫秒级开销，同一上游模型返回的图
+# 嵌的是同一份 ICC，缓存后色彩转换只剩 apply 的像素级成本
+if ImageCms is not None:
+    try:
+        _SRGB_PROFILE = ImageCms.createProfile("sRGB")
+    except Exception:  # pragma: no cover
+        _SRGB_PROFILE = None
+else:
+    _SRGB_PROFILE = None
+# key: (sha256(icc)[:16], 输入模式, 输出模式)；不同 ICC 数量极少，不设上限
+_XFORM_CACHE: dict = {}
+
+
+def _get_srgb_transform(icc: bytes, in_mode: str, out_mode: str):
+    """获取（或构建并缓存）源 ICC -> sRGB 的 LCMS 变换"""
+    key = (hashlib.sha256(icc).digest()[:16], in_mode, out_mode)
+    transform = _XFORM_CACHE.get(key)
+    if transform is None:
+        src_profile = ImageCms.ImageCmsProfile(BytesIO(icc))
+        transform = ImageCms.buildTransform(src_profile, _SRGB_PROFILE, in_mode, out_mode)
+        _XFORM_CACHE[key] = transform
+    return transform
+
+def _normalize_image_file(file_path_str: str, filename: str) -> str:
+    """对已落盘的下载图做快速路径检查 + sRGB 归一化（模块级纯函数，可在子进程执行）
+
+    Pillow 的编解码虽然会释放 GIL，但模式检查/alpha 提取等 Python 层工作
+    仍在单线程串行；放到进程池后并发保存的吞吐随核数近线性扩展。
+
+    Returns:
+        最终文件名（归一化可能改变扩展名）；失败时保留原始文件并返回原文件名
+    """
+    file_path = Path(file_path_str)
+    # 文件名主干只算一次，两个保存分支直接拼目标扩展名
+    stub = os.path.splitext(filename)[0]
+    try:
+        # Image.open 只解析文件头，快速路径下不触发整图解码
+        im = Image.open(file_path)
+
+        # 快速路径：上游返回不带 ICC 的裸 JPEG（JPEG 无 alpha，必然不透明），
+        # 解码+色彩转换+重编码全是无谓开销，直接保留原始字节
+        if im.format == "JPEG" and "icc_profile" not in im.info:
+            im.close()
+            if file_path.suffix.lower() not in (".jpg", ".jpeg"):
+                new_filename = stub + ".jpg"
+                file_path.rename(file_path.with_name(new_filename))
+                filename = new_filename
+            logger.info("⚡ 上游为无 ICC 的 JPEG，原样保留（跳过解码/重编码）")
+            return filename
+
+        im.load()
+
+        # 统一转换到 sRGB，并移除 ICC profile
+        # 说明：<img> 通常会做 ICC/广色域到显示器色域的转换，但 2D canvas 往往工作在 sRGB，
+        # 导致同图在聊天与画板“观感不一致”。我们在落盘前把像素值归一化到 sRGB 并去掉 ICC。
+        # 主流上游几乎不嵌 ICC：先取一次 icc，没有就整块跳过（含后面的 pop）
+        icc = getattr(im, "info", {}).get("icc_profile")
+        if icc:
+            if ImageCms is not None and _SRGB_PROFILE is not None:
+                try:
+                    output_mode = "RGBA" if (
+                        im.mode in ("RGBA", "LA") or ("transparency" in getattr(im, "info", {}))
+                    ) else "RGB"
+                    # 变换按源 ICC 哈希缓存，重复下载同一上游的图时免去重建
+                    transform = _get_srgb_transform(icc, im.mode, output_mode)
+                    if output_mode == im.mode:
+                        # 模式不变时原地应用（LCMS 直接写回同一像素缓冲），
+                        # 免去分配第二份整图缓冲，瞬时内存减半
+                        ImageCms.applyTransform(im, transform, inPlace=True)
+                    else:
+                        im = ImageCms.applyTransform(im, transform)
+                except Exception:
+                    # ICC 转换失败：退化为普通模式转换（不抛）
+                    pass
+
+            # 彻底去掉 ICC（避免浏览器两条渲染链路按不同 profile 解释）
+            try:
+                if getattr(im, "info", None):
+                    im.info.pop("icc_profile", None)
+            except Exception:
+                pass
+
+        # 关键策略：
+        # - 若图片不透明：统一存为 JPEG（去掉 PNG 的 gAMA/sRGB/cHRM 等色彩块差异，减少 <img> vs canvas 偏色）
+        # - 若图片含透明：存为 PNG（保留 alpha）
+        has_alpha = im.mode in ("RGBA", "LA") or ("transparency" in getattr(im, "info", {}))
+        is_transparent = False
+        arr = None  # RGBA 像素数组，alpha 检查和 RGB 转换共用一次物化
+        if has_alpha:
+            try:
+                if _np is not None and im.mode == "RGBA":
+                    # 向量化 min（SSE2/AVX2），免去 getchannel 的通道拷贝
+                    arr = _np.asarray(im)
+                    is_transparent = int(arr[..., 3].min()) < 255
+                else:
+                    alpha = im.getchannel("A")
+                    lo, hi = alpha.getextrema()
+                    is_transparent = lo < 255
+            except Exception:
+                is_transparent = True
+
+        if not is_transparent:
+            # Opaque -> JPEG
+            if im.mode != "RGB":
+                if arr is not None:
+                    # 复用 alpha 检查时物化的数组：切掉 alpha 平面直接成图，
+                    # 跳过 convert("RGB") 的整套模式转换机制
+                    im = Image.fromarray(_np.ascontiguousarray(arr[..., :3]))
+                else:
+                    im = im.convert("RGB")
+            new_filename = stub + ".jpg"
+            new_path = file_path.with_name(new_filename)
+            _save_jpeg(im, new_path)
+        else:
+            # Transparent -> PNG
+            new_filename = stub + ".png"
+            new_path = file_path.with_name(new_filename)
+            if im.mode not in ("RGBA", "RGB"):
+                im = im.convert("RGBA")
+            im.save(new_path, format="PNG", optimize=False, compress_level=PNG_COMPRESS_LEVEL)
+
+        # 归一化改变了扩展名时，删掉原始下载文件
+        if new_path != file_path:
+            file_path.unlink(missing_ok=True)
+        logger.info("🎛️ 已进行 sRGB 归一化并保存（移除 ICC profile）")
+        return new_filename
+    except Exception as e:
+        logger.warning(f"⚠️ sRGB 归一化失败，保留原始下载文件: {e}")
+        return filename
+
+
+# 图片归一化进程池（懒创建）：max_workers 跟随核数
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+    return _process_pool
+
+
+# 下载专用共享 httpx.AsyncClient：连接池跨下载存活（同一上游多张图只握手一次）
+_DOWNLOAD_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+_DOWNLOAD_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+_download_client: Optional[httpx.AsyncClient] = None
+
+# API 调用共享的同步客户端：keep-alive 连接池跨工具调用存活，
+# 每次生成/编辑省掉一次 TCP+TLS 握手（~1-2 RTT）；安装 h2 时自动启用 HTTP/2
+_API_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+try:
+    HTTP = httpx.Client(http2=True, timeout=_DOWNLOAD_TIMEOUT, limits=_API_LIMITS)
+except ImportError:  # pragma: no cover
+    HTTP = httpx.Client(timeout=_DOWNLOAD_TIMEOUT, limits=_API_LIMITS)
+
+# 工具函数以同步方式被 LangGraph 在工作线程中调用，下载协程统一跑在
+# 一个常驻的后台事件循环线程上（共享客户端的连接池绑定在该循环上）
+_download_loop: Optional[asyncio.AbstractEventLoop] = None
+_download_loop_lock = threading.Lock()
+
+
+def _get_download_loop() -> asyncio.AbstractEventLoop:
+    """获取（懒创建）下载专用的后台事件循环线程"""
+    global _download_loop
+    with _download_loop_lock:
+        if _download_loop is None or _download_loop.is_closed():
+            _download_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_download_loop.run_forever,
+                name="image-download-loop",
+                daemon=True,
+            ).start()
+    return _download_loop
+
+
+def _get_download_client() -> httpx.AsyncClient:
+    """获取共享下载客户端（只在下载循环内调用，无需加锁）"""
+    global _download_client
+    if _download_client is None or _download_client.is_closed:
+        _download_client = httpx.AsyncClient(
+            timeout=_DOWNLOAD_TIMEOUT, limits=_DOWNLOAD_LIMITS, follow_redirects=True
+        )
+    return _download_client
+
 
 def download_and_save_image(image_url: str, prompt: str = "") -> str:
     """
-    下载图片并保存到本地
-    
+    下载图片并保存到本地（同步封装，供同步工具函数调用）
+
+    实际下载在后台事件循环上异步流式执行：多张图并行生成时，
+    各下载互不阻塞，总耗时从 N×RTT 降到 ~1×RTT。
+
     Args:
         image_url: 图片URL
         prompt: 提示词（用于生成文件名）
-    
+
+    Returns:
+        本地文件路径（相对路径）
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        download_and_save_image_async(image_url, prompt), _get_download_loop()
+    )
+    return future.result()
+
+
+# 批量下载的并发上限：避免一次 fan-out 打满上游 CDN 或本地磁盘
+DOWNLOAD_MAX_CONCURRENCY = 8
+
+# 上游URL -> 本地路径 的小 LRU：重试/重复编辑同一张图时免去整个下载+归一化
+# （只在下载循环线程上读写，无需加锁；失败结果不入缓存）
+_URL_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_URL_CACHE_MAX = 256
+
+
+def download_and_save_images_batch(image_urls: list, prompt: str = "") -> list:
+    """
+    并发下载多张图片并保存到本地（同步封装，供同步工具函数调用）
+
+    N 张图的总耗时从 N×下载延迟降到 ~1×下载延迟（受并发上限约束）。
+
+    Args:
+        image_urls: 图片URL列表
+        prompt: 提示词（用于生成文件名）
+
+    Returns:
+        本地路径列表（与输入顺序一致；单张失败时该位置为原始URL）
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        download_and_save_images_batch_async(list(image_urls), prompt), _get_download_loop()
+    )
+    return future.result()
+
+
+async def download_and_save_images_batch_async(image_urls: list, prompt: str = "") -> list:
+    """并发下载多张图片（Semaphore 限流 + gather）"""
+    sem = asyncio.Semaphore(DOWNLOAD_MAX_CONCURRENCY)
+
+    async def _dl(url: str) -> str:
+        async with sem:
+            # 单张失败时 download_and_save_image_async 返回原始URL，不中断整批
+            return await download_and_save_image_async(url, prompt)
+
+    return list(await asyncio.gather(*(_dl(url) for url in image_urls)))
+
+
+async def download_and_save_image_async(image_url: str, prompt: str = "") -> str:
+    """
+    异步流式下载图片并保存到本地
+
+    Args:
+        image_url: 图片URL
+        prompt: 提示词（用于生成文件名）
+
     Returns:
         本地文件路径（相对路径）
     """
     try:
+        # 同一 URL 已下载过：直接复用本地文件
+        cached = _URL_CACHE.get(image_url)
+        if cached is not None:
+            _URL_CACHE.move_to_end(image_url)
+            logger.info(f"♻️ 命中下载缓存: {image_url} -> {cached}")
+            return cached
+
         logger.info(f"📥 开始下载图片: {image_url}")
-        
-        # 下载图片
-        response = requests.get(image_url, timeout=60)
-        response.raise_for_status()
-        
+
         # 从URL获取文件扩展名，如果没有则默认为png
         parsed_url = urlparse(image_url)
         path = parsed_url.path
         ext = os.path.splitext(path)[1] or ".png"
         if not ext.startswith("."):
             ext = ".png"
-        
+
         # 生成唯一文件名：时间戳_随机ID_提示词前20字符
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        # 清理提示词，只保留字母数字和空格，用于文件名
-        safe_prompt = "".join(c if c.isalnum() or c in (" ", "-", "_") else "" for c in prompt[:30])
-        safe_prompt = safe_prompt.replace(" ", "_")
+        # time_ns 十六进制保持可按时间排序；token_hex(4) 比整个 UUID4 生成+切片便宜得多
+        timestamp = f"{time.time_ns():x}"
+        unique_id = secrets.token_hex(4)
+        # 清理提示词，只保留 ASCII 字母数字和空格，用于文件名
+        safe_prompt = (
+            prompt[:30].encode("ascii", "ignore").translate(None, _ASCII_DELETE)
+            .replace(b" ", b"_").decode("ascii")
+        )
         filename = f"{timestamp}_{unique_id}_{safe_prompt}{ext}" if safe_prompt else f"{timestamp}_{unique_id}{ext}"
-        
+
         file_path = IMAGES_DIR / filename
 
-        # 保存文件（优先进行 sRGB 归一化，避免 Excalidraw(canvas) 与聊天(<img>) 观感不一致）
-        saved = False
+        # 流式下载：分块异步写盘（aiofiles），不把整张压缩图读进内存
+        client = _get_download_client()
+        async with client.stream("GET", image_url) as response:
+            response.raise_for_status()
+            async with aiofiles.open(file_path, "wb") as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
+
+        # sRGB 归一化：CPU 密集部分放到子进程池，并发下载时可吃满多核
+        # （子进程失败时退回当前线程内联处理；失败时原始下载文件已在盘上，直接保留）
         if Image is not None and BytesIO is not None:
+            loop = asyncio.get_running_loop()
             try:
-                im = Image.open(BytesIO(response.content))
-                im.load()
-
-                # 统一转换到 sRGB，并移除 ICC profile
-                # 说明：<img> 通常会做 ICC/广色域到显示器色域的转换，但 2D canvas 往往工作在 sRGB，
-                # 导致同图在聊天与画板“观感不一致”。我们在落盘前把像素值归一化到 sRGB 并去掉 ICC。
-                if ImageCms is not None:
-                    icc = getattr(im, "info", {}).get("icc_profile")
-                    if icc:
-                        try:
-                            src_profile = ImageCms.ImageCmsProfile(BytesIO(icc))
-                            dst_profile = ImageCms.createProfile("sRGB")
-                            output_mode = "RGBA" if (
-                                im.mode in ("RGBA", "LA") or ("transparency" in getattr(im, "info", {}))
-                            ) else "RGB"
-                            im = ImageCms.profileToProfile(im, src_profile, dst_profile, outputMode=output_mode)
-                        except Exception:
-                            # ICC 转换失败：退化为普通模式转换（不抛）
-                            pass
-
-                # 彻底去掉 ICC（避免浏览器两条渲染链路按不同 profile 解释）
-                try:
-                    if getattr(im, "info", None) and "icc_profile" in im.info:
-                        im.info.pop("icc_profile", None)
-                except Exception:
-                    pass
-
-                # 关键策略：
-                # - 若图片不透明：统一存为 JPEG（去掉 PNG 的 gAMA/sRGB/cHRM 等色彩块差异，减少 <img> vs canvas 偏色）
-                # - 若图片含透明：存为 PNG（保留 alpha）
-                has_alpha = im.mode in ("RGBA", "LA") or ("transparency" in getattr(im, "info", {}))
-                is_transparent = False
-                if has_alpha:
-                    try:
-                        alpha = im.getchannel("A")
-                        lo, hi = alpha.getextrema()
-                        is_transparent = lo < 255
-                    except Exception:
-                        is_transparent = True
-
-                if not is_transparent:
-                    # Opaque -> JPEG
-                    if im.mode != "RGB":
-                        im = im.convert("RGB")
-                    filename = os.path.splitext(filename)[0] + ".jpg"
-                    file_path = IMAGES_DIR / filename
-                    im.save(file_path, format="JPEG", quality=95, optimize=True, progressive=True)
-                else:
-                    # Transparent -> PNG
-                    filename = os.path.splitext(filename)[0] + ".png"
-                    file_path = IMAGES_DIR / filename
-                    if im.mode not in ("RGBA", "RGB"):
-                        im = im.convert("RGBA")
-                    im.save(file_path, format="PNG", optimize=True)
-
-                saved = True
-                logger.info("🎛️ 已进行 sRGB 归一化并保存（移除 ICC profile）")
+                filename = await loop.run_in_executor(
+                    _get_process_pool(), _normalize_image_file, str(file_path), filename
+                )
             except Exception as e:
-                logger.warning(f"⚠️ sRGB 归一化失败，回退为原始字节保存: {e}")
+                logger.warning(f"⚠️ 归一化子进程执行失败，改为当前进程处理: {e}")
+                filename = _normalize_image_file(str(file_path), filename)
+            file_path = IMAGES_DIR / filename
 
-        if not saved:
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-        
         # 返回HTTP访问路径（以/storage/开头，前端可以直接使用）
         http_path = f"/storage/images/{filename}"
+        _URL_CACHE[image_url] = http_path
+        if len(_URL_CACHE) > _URL_CACHE_MAX:
+            _URL_CACHE.popitem(last=False)
         logger.info(f"✅ 图片已保存到本地: {file_path}")
         logger.info(f"   可通过HTTP访问: {http_path}")
         return http_path
@@ -184,22 +484,15 @@ def generate_image_tool(prompt: str) -> str:
             return "Error generating image: 未配置 OPENAI_API_KEY（请在 backend/.env 设置，可参考 env.example）"
         logger.info(f"🎨 开始生成图像: prompt={prompt}")
 
-        url = f"{OPENAI_BASE_URL.rstrip('/')}/images/generations"
-        
         payload = {
             "model": IMAGE_MODEL_NAME,  # 使用指定的模型（可通过环境变量覆盖）
             "prompt": prompt,
             "image_size": "1024x1024" # 添加默认尺寸，避免API报错
         }
         
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         logger.info(f"🚀 调用 SiliconFlow API: model={payload['model']}")
         
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
+        response = HTTP.post(GENERATIONS_URL, json=payload, headers=API_HEADERS)
         
         if response.status_code != 200:
             error_msg = f"API调用失败: status={response.status_code}, body={response.text}"
@@ -211,26 +504,26 @@ def generate_image_tool(prompt: str) -> str:
         
         # 解析返回结果
         # 预期格式: {"images": [{"url": "..."}]}
-        if "images" in data and len(data["images"]) > 0:
-            image_url = data["images"][0].get("url")
-            if image_url:
-                # 下载并保存图片到本地
-                local_path = download_and_save_image(image_url, prompt)
-                
-                # 返回结果：image_url 使用本地路径，确保历史记录中保存的是本地路径（不会过期）
-                # original_url 保留原始URL用于调试或备份
-                # 注意：image_url字段是用于后续edit_image工具的主要标识符
-                result = {
-                    'image_url': local_path,  # 主要使用本地路径，前端直接使用这个，也是edit_image工具需要的URL
-                    'original_url': image_url,  # 保留原始URL作为备份
-                    'local_path': local_path,  # 明确标识本地路径
-                    'prompt': prompt,
-                    'message': f'图片已生成并保存到本地。图片URL: {local_path}。如需编辑此图片，请使用此URL。'
-                }
-                
-                result_json = json.dumps(result, ensure_ascii=False)
-                logger.info(f"✅ 图像生成成功: 已保存到本地 {local_path}, 原始URL={image_url}")
-                return result_json
+        image_urls = [img.get("url") for img in data.get("images", []) if img.get("url")]
+        if image_urls:
+            # 下载并保存图片到本地（多张时并发下载，结果字段沿用首张）
+            local_path = download_and_save_images_batch(image_urls, prompt)[0]
+            image_url = image_urls[0]
+
+            # 返回结果：image_url 使用本地路径，确保历史记录中保存的是本地路径（不会过期）
+            # original_url 保留原始URL用于调试或备份
+            # 注意：image_url字段是用于后续edit_image工具的主要标识符
+            result = {
+                'image_url': local_path,  # 主要使用本地路径，前端直接使用这个，也是edit_image工具需要的URL
+                'original_url': image_url,  # 保留原始URL作为备份
+                'local_path': local_path,  # 明确标识本地路径
+                'prompt': prompt,
+                'message': f'图片已生成并保存到本地。图片URL: {local_path}。如需编辑此图片，请使用此URL。'
+            }
+
+            result_json = json.dumps(result, ensure_ascii=False)
+            logger.info(f"✅ 图像生成成功: 已保存到本地 {local_path}, 原始URL={image_url}")
+            return result_json
         
         return f"Error: No image URL in response. Response: {json.dumps(data)}"
         
@@ -277,8 +570,6 @@ def edit_image_tool(prompt: str, image_url: str) -> str:
             actual_image_url = f"{base_url}{image_url}"
             logger.info(f"🔄 本地路径转换为完整URL: {image_url} -> {actual_image_url}")
         
-        url = f"{OPENAI_BASE_URL.rstrip('/')}/images/generations"
-        
         payload = {
             "model": EDIT_IMAGE_MODEL_NAME,
             "prompt": prompt,
@@ -286,14 +577,9 @@ def edit_image_tool(prompt: str, image_url: str) -> str:
             # 编辑模型可能不支持 image_size，先不传或根据文档确认
         }
         
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         logger.info(f"🚀 调用 SiliconFlow API: model={payload['model']}")
         
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
+        response = HTTP.post(GENERATIONS_URL, json=payload, headers=API_HEADERS)
         
         if response.status_code != 200:
             error_msg = f"API调用失败: status={response.status_code}, body={response.text}"
@@ -304,27 +590,27 @@ def edit_image_tool(prompt: str, image_url: str) -> str:
         logger.info(f"📥 API响应: {json.dumps(data, ensure_ascii=False)}")
         
         # 解析返回结果
-        if "images" in data and len(data["images"]) > 0:
-            new_image_url = data["images"][0].get("url")
-            if new_image_url:
-                # 下载并保存图片到本地
-                local_path = download_and_save_image(new_image_url, prompt)
-                
-                # 返回结果：image_url 使用本地路径，确保历史记录中保存的是本地路径（不会过期）
-                # original_url 保留原始URL用于调试或备份
-                # 注意：image_url字段是用于后续edit_image工具的主要标识符
-                result = {
-                    'image_url': local_path,  # 主要使用本地路径，前端直接使用这个，也是edit_image工具需要的URL
-                    'original_url': new_image_url,  # 保留原始URL作为备份
-                    'local_path': local_path,  # 明确标识本地路径
-                    'prompt': prompt,
-                    'source_image': image_url,  # 记录源图片URL
-                    'message': '图片已编辑并保存到本地'
-                }
-                
-                result_json = json.dumps(result, ensure_ascii=False)
-                logger.info(f"✅ 图像编辑成功: 已保存到本地 {local_path}, 原始URL={new_image_url}")
-                return result_json
+        new_image_urls = [img.get("url") for img in data.get("images", []) if img.get("url")]
+        if new_image_urls:
+            # 下载并保存图片到本地（多张时并发下载，结果字段沿用首张）
+            local_path = download_and_save_images_batch(new_image_urls, prompt)[0]
+            new_image_url = new_image_urls[0]
+
+            # 返回结果：image_url 使用本地路径，确保历史记录中保存的是本地路径（不会过期）
+            # original_url 保留原始URL用于调试或备份
+            # 注意：image_url字段是用于后续edit_image工具的主要标识符
+            result = {
+                'image_url': local_path,  # 主要使用本地路径，前端直接使用这个，也是edit_image工具需要的URL
+                'original_url': new_image_url,  # 保留原始URL作为备份
+                'local_path': local_path,  # 明确标识本地路径
+                'prompt': prompt,
+                'source_image': image_url,  # 记录源图片URL
+                'message': '图片已编辑并保存到本地'
+            }
+
+            result_json = json.dumps(result, ensure_ascii=False)
+            logger.info(f"✅ 图像编辑成功: 已保存到本地 {local_path}, 原始URL={new_image_url}")
+            return result_json
         
         return f"Error: No image URL in response. Response: {json.dumps(data)}"
         
@@ -25,6 +25,15 @@ _SKILLS_ROOT = (Path(__file__).parent.parent.parent / "skills").resolve()
 _CUSTOM_ROOT = _SKILLS_ROOT / "custom"
 
 
+def _invalidate_agent() -> None:
+    """skill 文件变更后清掉缓存的 Agent，新 skill 在下一轮对话即可被发现
+
+    函数内导入：agent_service 在模块级依赖本模块，避免循环导入。
+    """
+    from app.services import agent_service
+    agent_service.invalidate_agent()
+
+
 def _safe_resolve(path_str: str) -> Path | None:
     """
     将路径字符串解析为绝对路径，并验证是否在 skills/ 目录内。
@@ -172,6 +181,7 @@ def init_skill_tool(skill_name: str) -> str:
         return f"Error: 初始化失败\n{output}\n{err}"
 
     skill_dir = _CUSTOM_ROOT / skill_name
+    _invalidate_agent()
     return f"✅ Skill '{skill_name}' 初始化成功\n路径: {skill_dir}\n\n{output}"
 
 
@@ -200,6 +210,7 @@ def write_skill_file_tool(path: str, content: str) -> str:
         resolved.parent.mkdir(parents=True, exist_ok=True)
         resolved.write_text(content, encoding="utf-8")
         logger.info(f"write_skill_file: 写入 {resolved}")
+        _invalidate_agent()
         return f"✅ 已写入: {resolved}"
     except Exception as e:
         return f"Error: 写入失败: {e}"
@@ -229,6 +240,7 @@ def delete_skill_file_tool(path: str) -> str:
     try:
         resolved.unlink()
         logger.info(f"delete_skill_file: 删除 {resolved}")
+        _invalidate_agent()
         return f"✅ 已删除: {resolved}"
     except Exception as e:
         return f"Error: 删除失败: {e}"